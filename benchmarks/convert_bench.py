@@ -0,0 +1,61 @@
+# -*- encoding:utf8 -*-
+"""Conversion of one page for display, per value vs per column.
+
+  $ python benchmarks/convert_bench.py [ROWS] [REPEAT]
+"""
+from __future__ import absolute_import, print_function
+import sys
+import timeit
+import datetime
+from decimal import Decimal
+from MySQLdb.constants import FIELD_TYPE
+from mystique.db import value_optimize
+from mystique.convert import RowConverter
+
+
+TYPES = (FIELD_TYPE.LONGLONG, FIELD_TYPE.VAR_STRING, FIELD_TYPE.NEWDECIMAL,
+         FIELD_TYPE.DATETIME, FIELD_TYPE.LONG, FIELD_TYPE.BLOB,
+         FIELD_TYPE.DOUBLE, FIELD_TYPE.VAR_STRING)
+
+
+def make_rows(n):
+    base = datetime.datetime(2016, 1, 1)
+    return tuple((i, 'name-%d' % i, Decimal('%d.%02d' % (i, i % 100)),
+                  base + datetime.timedelta(seconds=i),
+                  None if i % 7 == 0 else i % 1000,
+                  'x' * (i % 64), i / 3.0,
+                  None if i % 5 == 0 else 'tag%d' % (i % 10))
+                 for i in range(n))
+
+
+def per_value(rows, max_len=200):
+    # what the session and the view did before, convert then measure
+    ret = [tuple(value_optimize(v) for v in values) for values in rows]
+    sizemap = {}
+    for values in ret:
+        for i, v in enumerate(values):
+            size = min(len(v), max_len)
+            if sizemap.get(i, 0) < size:
+                sizemap[i] = size
+    return ret, sizemap
+
+
+def per_column(rows):
+    ret = RowConverter(TYPES).convert(rows)
+    return ret, ret.widths
+
+
+def main(argv):
+    n = int(argv[0]) if argv else 10000
+    repeat = int(argv[1]) if len(argv) > 1 else 5
+    rows = make_rows(n)
+    a, b = per_value(rows), per_column(rows)
+    assert [tuple(x) for x in a[0]] == [tuple(x) for x in b[0]]
+    assert [a[1][i] for i in range(len(TYPES))] == b[1]
+    for name, func in (('per value', per_value), ('per column', per_column)):
+        best = min(timeit.repeat(lambda: func(rows), number=1, repeat=repeat))
+        print('%-10s %d rows: %.1fms' % (name, n, best * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
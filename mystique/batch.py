@@ -0,0 +1,136 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import sys
+import time
+from contextlib import closing
+import MySQLdb
+import MySQLdb.cursors
+from mystique import export
+from mystique.log import logger
+from mystique.pool import is_gone_away
+
+
+def split_statements(text):
+    """splits sql on `;` outside of quotes and comments"""
+    statements = []
+    buf = []
+    quote = None
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if quote:
+            buf.append(c)
+            if c == '\\' and quote != '`' and i + 1 < n:
+                buf.append(text[i + 1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in ('"', "'", '`'):
+            quote = c
+            buf.append(c)
+        elif c == '#' or text.startswith('-- ', i) or text.startswith('--\n', i):
+            end = text.find('\n', i)
+            i = n if end < 0 else end
+            continue
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            buf.append(' ')
+            continue
+        elif c == ';':
+            statements.append(''.join(buf))
+            buf = []
+        else:
+            buf.append(c)
+        i += 1
+    statements.append(''.join(buf))
+    return [x.strip() for x in statements if x.strip()]
+
+
+class BatchRunner(object):
+    """Runs statements one after another on one connection, results are
+    streamed to `out`, timings go to `log` (none when it is None) and
+    errors always go to `err` (stderr by default)"""
+
+    def __init__(self, database, out=None, fmt='tsv', header=True, force=False,
+                 batch_size=1000, log=None, err=None):
+        self._database = database
+        self._out = out or sys.stdout
+        self._fmt = fmt
+        self._header = header
+        self._force = force
+        self._batch_size = batch_size
+        self._log = log
+        self._err = err or sys.stderr
+        self.timings = [] # [(statement, rows, seconds), ...]
+        self.errors = 0
+
+    def _report(self, msg, out=None):
+        out = out or self._log
+        if out is not None:
+            out.write('%s\n' % msg)
+            out.flush()
+
+    def run(self, statements):
+        with self._database.pool.connection() as conn:
+            for i, statement in enumerate(statements):
+                started_at = time.time()
+                try:
+                    rows, has_result = self._execute(conn, statement)
+                except MySQLdb.Error as e:
+                    self.errors += 1
+                    self._report('-- [%d] ERROR %s\n%s' % (
+                        i + 1, ', '.join(str(x) for x in e.args), statement),
+                        out=self._err)
+                    if self._force and not is_gone_away(e):
+                        continue
+                    raise
+                elapsed = time.time() - started_at
+                self.timings.append((statement, rows, elapsed))
+                self._report('-- [%d] %d rows %s in %.3fs' %
+                             (i + 1, rows,
+                              'in set' if has_result else 'affected', elapsed))
+        return self.errors
+
+    def _execute(self, conn, statement):
+        logger.info('[BATCH] %s' % statement)
+        with closing(conn.cursor(MySQLdb.cursors.SSCursor)) as cursor:
+            cursor.execute(statement)
+            if not cursor.description:
+                conn.commit()
+                return cursor.rowcount, False
+            writer = export.new_writer(
+                self._fmt, self._out, tuple(x[0] for x in cursor.description),
+                header=self._header)
+            rows = 0
+            while True:
+                batch = cursor.fetchmany(self._batch_size)
+                if not batch:
+                    break
+                writer.write(batch)
+                rows += len(batch)
+            self._out.flush()
+            return rows, True
+
+
+def run(opts):
+    from mystique import config
+    from mystique.db import Database
+    if opts.execute:
+        text = opts.execute
+    elif opts.file == '-':
+        text = sys.stdin.read()
+    else:
+        with open(opts.file) as f:
+            text = f.read()
+    statements = split_statements(text)
+    database = Database(**config.load_config(opts))
+    runner = BatchRunner(database, fmt=opts.format, header=not opts.no_header,
+                         force=opts.force,
+                         log=None if opts.quiet else sys.stderr)
+    try:
+        return 1 if runner.run(statements) else 0
+    except MySQLdb.Error:
+        return 1
+    finally:
+        database.close()
@@ -0,0 +1,62 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+from mystique import startup
+import sys
+import mystique
+from mystique.log import logger
+
+
+# subcommand => module with main(argv), imported only when it is used
+SUBCOMMANDS = dict(export='mystique.export', dump='mystique.dump')
+
+
+def _parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='%s v%s' % (mystique.__mystique__, mystique.__version__),
+        epilog='see "mystique export -h" to export a table or a query, '
+        '"mystique dump -h" to dump a large table in parallel')
+    parser.add_argument('-d', '--db', type=str, help='the database name')
+    parser.add_argument('-c', '--config', type=str, help='a path to config file')
+    parser.add_argument('-n', '--name', type=str, help='the name of connection alias')
+    batch = parser.add_argument_group('batch mode, runs without the terminal UI')
+    source = batch.add_mutually_exclusive_group()
+    source.add_argument('-e', '--execute', type=str,
+                        help='statements to run, separated by ";"')
+    source.add_argument('-f', '--file', type=str,
+                        help='a sql file to run ("-" for stdin)')
+    batch.add_argument('--format', type=str, default='tsv',
+                       choices=('csv', 'tsv', 'jsonl'),
+                       help='format of results (default: tsv)')
+    batch.add_argument('--no-header', action='store_true',
+                       help='omit the header line of csv and tsv')
+    batch.add_argument('--force', action='store_true',
+                       help='continue after a failed statement')
+    batch.add_argument('-q', '--quiet', action='store_true',
+                       help='no timings on stderr')
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    logger.debug('Bootup mystique...')
+
+    if argv and argv[0] in SUBCOMMANDS:
+        module = __import__(SUBCOMMANDS[argv[0]], fromlist=['main'])
+        return module.main(argv[1:])
+
+    opts = _parser().parse_args(argv)
+    logger.debug('Options=%s' % str(opts))
+
+    if opts.execute or opts.file:
+        from mystique import batch
+        return batch.run(opts)
+
+    # urwid and blinker are loaded only for the terminal UI
+    from mystique import mystique as ui
+    startup.mark('import')
+    return ui.run(opts)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,6 @@
 # -*- encoding:utf8 -*-
 from __future__ import absolute_import
 import os
-import yaml
 
 from mystique import env
 from mystique.log import logger
@@ -24,6 +23,28 @@ def _estimate_config_path():
     return None
 
 
+def _load_alias(stream, name, path):
+    """parses the whole file into nodes but builds only the chosen alias"""
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)(stream)
+    try:
+        root = loader.get_single_node()
+        # TODO validate config schema
+        nodes = root.value if isinstance(root, yaml.MappingNode) else []
+        aliases = [loader.construct_object(k) for k, _ in nodes]
+        if not aliases:
+            raise ConfigError('Configuration is empty!')
+        elif not name and len(aliases) > 1:
+            raise ConfigError('Specify one name from %s for connection alias' % '|'.join(aliases))
+        elif name and name not in aliases:
+            raise ConfigError('Name "%s" is not found in %s' % (name, path))
+        name = aliases[0] if len(aliases) == 1 else name
+        node = nodes[aliases.index(name)][1]
+        return name, loader.construct_document(node)
+    finally:
+        loader.dispose()
+
+
 def load_config(opts):
     path = opts.config or env.MYSTIQUE_ENV_CONFIG_FILE \
         or _estimate_config_path()
@@ -32,18 +53,9 @@ def load_config(opts):
             ('|'.join(DEFAULT_CONFIG_NAMES), '|'.join(CONFIG_LOAD_DIR)))
     logger.info('load config: path=%s' % path)
 
-    config = yaml.load(open(path))
-
-    # TODO validate config schema
-    aliases = config and config.keys()
-    if not aliases:
-        raise ConfigError('Configuration is empty!')
-    elif not opts.name and len(aliases) > 1:
-        raise ConfigError('Specify one name from %s for connection alias' % '|'.join(aliases))
-    elif opts.name and opts.name not in aliases:
-        raise ConfigError('Name "%s" is not found in %s' % (opts.name, path))
-
-    config = config[aliases[0]] if len(aliases) == 1 else config[opts.name]
+    with open(path) as f:
+        name, config = _load_alias(f, opts.name, path)
+    config.setdefault('alias', name)
 
     if opts.db:
         config['db'] = opts.db
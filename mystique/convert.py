@@ -0,0 +1,83 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+from MySQLdb.constants import FIELD_TYPE
+
+
+class Rows(list):
+    """Converted rows with the widest value and total length per column"""
+
+    def __init__(self, rows=(), widths=None, nbytes=0):
+        super(Rows, self).__init__(rows)
+        self.widths = widths
+        self.nbytes = nbytes
+
+
+def _strings(col):
+    # str/unicode already, only NULL has to be replaced
+    if None in col:
+        return ['' if v is None else v for v in col]
+    return col
+
+
+def _numbers(col):
+    # None in col is a C level compare for int and float
+    if None in col:
+        return ['' if v is None else str(v) for v in col]
+    return list(map(str, col))
+
+
+def _objects(col):
+    # decimal, datetime... compare None in python, test each value once
+    return ['' if v is None else str(v) for v in col]
+
+
+def _any(col):
+    # unknown type, the same as db.value_optimize
+    return ['' if v is None else v if isinstance(v, basestring) else str(v)
+            for v in col]
+
+
+_CONVERTERS = {}
+for _name, _func in (
+        ('DECIMAL', _objects), ('NEWDECIMAL', _objects),
+        ('TINY', _numbers), ('SHORT', _numbers), ('LONG', _numbers),
+        ('LONGLONG', _numbers), ('INT24', _numbers), ('YEAR', _numbers),
+        ('FLOAT', _numbers), ('DOUBLE', _numbers),
+        ('TIMESTAMP', _objects), ('DATE', _objects), ('TIME', _objects),
+        ('DATETIME', _objects), ('NEWDATE', _objects),
+        ('VARCHAR', _strings), ('VAR_STRING', _strings), ('STRING', _strings),
+        ('TINY_BLOB', _strings), ('MEDIUM_BLOB', _strings),
+        ('LONG_BLOB', _strings), ('BLOB', _strings), ('ENUM', _strings),
+        ('SET', _strings), ('JSON', _strings), ('BIT', _strings),
+        ('GEOMETRY', _strings), ('NULL', _any)):
+    if hasattr(FIELD_TYPE, _name):
+        _CONVERTERS[getattr(FIELD_TYPE, _name)] = _func
+
+
+class RowConverter(object):
+    """Converts a batch of rows to display strings column by column.
+
+    A converter is chosen once per column from the type codes of
+    cursor.description, and the widths are measured in the same pass.
+    """
+
+    def __init__(self, types):
+        self._funcs = [_CONVERTERS.get(x, _any) for x in types]
+
+    @classmethod
+    def of(cls, description):
+        return cls([x[1] for x in description or ()])
+
+    def convert(self, rows):
+        if not rows:
+            return Rows()
+        columns = []
+        widths = []
+        nbytes = 0
+        for func, col in zip(self._funcs, zip(*rows)):
+            col = func(col)
+            lens = list(map(len, col))
+            widths.append(max(lens))
+            nbytes += sum(lens)
+            columns.append(col)
+        return Rows(zip(*columns), widths=widths, nbytes=nbytes)
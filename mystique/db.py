@@ -1,9 +1,53 @@
 # -*- encoding:utf8 -*-
 from __future__ import absolute_import
 
+import re
+import time
+import threading
 import MySQLdb
+import MySQLdb.cursors
 from contextlib import closing, contextmanager
+from functools import wraps
+from mystique import util
 from mystique.log import logger
+from mystique.pool import ConnectionPool, is_gone_away, is_interrupted
+from mystique.schema import SchemaCache
+from mystique.resultcache import ResultCache
+from mystique.convert import RowConverter
+from mystique.stats import NO_STATS, read_status, status_overhead
+from mystique.explain import ExplainError
+
+
+DEFAULT_OPTIONS = dict(
+    alias = None,
+    pool_size = 4,
+    pool_idle_timeout = 300,
+    pool_ping_interval = 30,
+    stream_results = 'auto', # True | False | 'auto'
+    stream_threshold = 10000,
+    page_size = 100,
+    page_cache_size = 10,
+    prefetch_depth = 1,
+    prefetch_memory = 32 * 1024 * 1024,
+    schema_cache = True,
+    schema_cache_ttl = 600,
+    schema_cache_dir = '~/.mystique/cache',
+    exact_count = False, # count(*) in background after the estimate
+    count_timeout = 5,
+    count_cache_ttl = 600,
+    preview_length = 256, # text/blob cells cut on the server while browsing
+    result_cache = False, # pages of results shared by sessions
+    result_cache_ttl = 300,
+    result_cache_memory = 64 * 1024 * 1024,
+    spill = False, # streamed results are kept in a local sqlite file
+    spill_dir = None, # the temp dir by default
+    spill_max_bytes = 1024 * 1024 * 1024,
+    server_stats = False, # SHOW SESSION STATUS deltas of each page read
+)
+
+
+# types with values of up to 16MB-4GB, tinytext/tinyblob are small enough
+_LARGE_TYPE = re.compile(r'^(?:(?:medium|long)?(?:text|blob)|json)\b', re.I)
 
 
 def value_optimize(v):
@@ -14,37 +58,395 @@ def value_optimize(v):
     return v
 
 
+def quote_identifier(name):
+    return '`%s`' % name.replace('`', '``')
+
+
+def keyset_condition(columns, values, op):
+    """(a, b) > (x, y) as `a > x or (a = x and b > y)` to stay on the index"""
+    strict = op[0]
+    terms = []
+    for i, column in enumerate(columns):
+        cond = ['%s = %%s' % quote_identifier(c) for c in columns[:i]]
+        cond.append('%s %s %%s' % (quote_identifier(column),
+                                   op if i == len(columns) - 1 else strict))
+        terms.append('(%s)' % ' and '.join(cond))
+    params = []
+    for i in range(len(columns)):
+        params.extend(values[:i + 1])
+    return ' or '.join(terms), tuple(params)
+
+
+def retry_on_gone_away(func):
+    @wraps(func)
+    def _wrapped(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if not is_gone_away(e):
+                raise
+            logger.info('[DB] retry %s: %s' % (func.__name__, e))
+            return func(*args, **kwargs)
+    return _wrapped
+
+
+class ResultStream(object):
+
+    def __init__(self, database, query, server_side=False, stats=NO_STATS):
+        self._database = database
+        self.server_side = server_side
+        self.stats = stats # of the page being read, set by the reader
+        self.rows_read = 0
+        self.position = 0 # rows handed out by fetch
+        self._pending = []
+        self._exhausted = False
+        self._status = None
+        self._conn = database.pool.acquire()
+        stats.mark('connect')
+        try:
+            if stats.server_status:
+                self._status = self._read_status()
+                stats.start()
+            self._cursor = self._conn.cursor(MySQLdb.cursors.SSCursor) \
+                if server_side else self._conn.cursor()
+            self._cursor.execute(query)
+            stats.mark('execute')
+            if not server_side:
+                self._status_after() # rows are on this side already
+        except Exception as e:
+            conn, self._conn = self._conn, None
+            if is_gone_away(e):
+                database.pool.discard(conn)
+            else:
+                database.pool.release(conn)
+            raise
+        desc = self._cursor.description
+        self.description = tuple(x[0] for x in desc) if desc else ()
+        self.types = tuple(x[1] for x in desc) if desc else ()
+        if not desc:
+            self._exhausted = True
+
+    @property
+    def exhausted(self):
+        return self._exhausted
+
+    def fetch(self, size):
+        rows, self._pending = self._pending[:size], self._pending[size:]
+        if len(rows) < size:
+            rows.extend(self._fetch(size - len(rows)))
+        self.position += len(rows)
+        return rows
+
+    def has_more(self):
+        if not self._pending:
+            self._pending = self._fetch(1)
+        return len(self._pending) > 0
+
+    def _fetch(self, size):
+        if self._exhausted:
+            return []
+        try:
+            rows = self._cursor.fetchmany(size)
+        except Exception as e:
+            self._abort(e)
+            raise
+        self.rows_read += len(rows)
+        if len(rows) < size:
+            self._exhausted = True
+            self._status_after()
+        return list(rows)
+
+    def _read_status(self):
+        with closing(self._conn.cursor()) as cursor:
+            return read_status(cursor)
+
+    def _status_after(self):
+        if self._status is not None:
+            before, self._status = self._status, None
+            after = self._read_status()
+            with closing(self._conn.cursor()) as cursor:
+                overhead = self._database.status_overhead(cursor)
+            self.stats.set_status(before, after, overhead)
+
+    def skip(self, count, batch_size=1000, sink=None):
+        """`sink` is called with the skipped rows, if given"""
+        while count > 0:
+            rows = self.fetch(min(count, batch_size))
+            if not rows:
+                break
+            if sink is not None:
+                sink(rows)
+            count -= len(rows)
+
+    def _abort(self, e=None):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        thread_id = conn.thread_id()
+        self._database.pool.discard(conn)
+        if e is None or not is_gone_away(e):
+            self._database.kill_query(thread_id)
+
+    def close(self):
+        if self._conn is None:
+            return
+        if self.server_side and not self._exhausted:
+            # closing an unbuffered cursor reads the rest of the result,
+            # throw the connection away and stop the query on the server
+            logger.info('[DB] abort streaming result after %d rows' %
+                        self.rows_read)
+            self._abort()
+            return
+        conn, self._conn = self._conn, None
+        try:
+            self._cursor.close()
+        except Exception as e:
+            if is_gone_away(e):
+                self._database.pool.discard(conn)
+                return
+        self._database.pool.release(conn)
+
+
 class _Connectable(object):
 
-    def __init__(self, config):
+    def __init__(self, config, pool=None, options=None):
         self._config = config
+        self._pool = pool or ConnectionPool(config)
+        self._options = options if options is not None \
+            else dict(DEFAULT_OPTIONS)
+
+    def config(self, name):
+        return self._config[name]
+
+    def option(self, name):
+        return self._options[name]
+
+    @property
+    def pool(self):
+        return self._pool
 
     @contextmanager
     def new_cursor(self):
-        with closing(MySQLdb.connect(**self._config)) as conn:
+        with self._pool.connection() as conn:
             with closing(conn.cursor()) as cursor:
                 yield cursor
 
+    def _select(self, sql, params=None, stats=NO_STATS):
+        """rows and description of a query, its phases are timed in stats"""
+        stats.start()
+        with self.new_cursor() as cursor:
+            stats.mark('connect')
+            before = read_status(cursor) if stats.server_status else None
+            stats.start()
+            cursor.execute(sql, params)
+            stats.mark('execute')
+            rows = cursor.fetchall()
+            description = cursor.description
+            if before is not None:
+                after = read_status(cursor)
+                stats.set_status(before, after,
+                                 self.status_overhead(cursor))
+        return rows, description
+
+    def status_overhead(self, cursor):
+        return status_overhead(cursor, (self._config.get('host'),
+                                        self._config.get('port'),
+                                        self._config.get('unix_socket')))
+
+    def estimate_rows(self, query):
+        if not query.lstrip().lower().startswith('select'):
+            return None
+        try:
+            with self.new_cursor() as cursor:
+                cursor.execute('explain %s' % query)
+                names = [x[0].lower() for x in cursor.description]
+                if 'rows' not in names:
+                    return None
+                idx = names.index('rows')
+                return max([int(x[idx] or 0) for x in cursor.fetchall()] or [0])
+        except MySQLdb.Error as e:
+            if is_interrupted(e):
+                raise
+            logger.info('[DB] can not estimate rows: %s' % e)
+            return None
+
 
 class Database(_Connectable):
 
     def __init__(self, **config):
         logger.info('[DB] config: %s' % str(config))
         self._config = config
-        super(Database, self).__init__(self._config)
+        self._options = util.pop_options(self._config, DEFAULT_OPTIONS)
+        pool = ConnectionPool(self._config,
+                              size=self.option('pool_size'),
+                              idle_timeout=self.option('pool_idle_timeout'),
+                              ping_interval=self.option('pool_ping_interval'))
+        super(Database, self).__init__(self._config, pool=pool,
+                                       options=self._options)
+        self._side_conn = None
+        self._side_lock = threading.Lock()
+        self._counts = {} # count query => (count, counted at)
+        key = self.option('alias') or '%s@%s_%s' % \
+            (config.get('user'), config.get('host'), config.get('port'))
+        self._schema = None
+        if self.option('schema_cache'):
+            self._schema = SchemaCache(self, key,
+                                       cache_dir=self.option('schema_cache_dir'),
+                                       ttl=self.option('schema_cache_ttl'))
+        # table status is read in one query even without the schema cache
+        self._status = self._schema or \
+            SchemaCache(self, key, ttl=self.option('schema_cache_ttl'))
+        self._version = None
+        self._results = None
+        if self.option('result_cache'):
+            self._results = ResultCache(self.option('result_cache_memory'),
+                                        self.option('result_cache_ttl'))
 
-    def config(self, name):
-        return self._config[name]
+    @property
+    def connect_args(self):
+        """arguments of MySQLdb.connect, without mystique options"""
+        return dict(self._config)
+
+    def open_stream(self, query, server_side=False, stats=NO_STATS):
+        return ResultStream(self, query, server_side=server_side, stats=stats)
+
+    def kill_query(self, thread_id):
+        # a side connection outside of the pool, which may be exhausted
+        with self._side_lock:
+            for retry in (True, False):
+                try:
+                    if self._side_conn is None:
+                        self._side_conn = MySQLdb.connect(**self._config)
+                    with closing(self._side_conn.cursor()) as cursor:
+                        cursor.execute('kill query %d' % thread_id)
+                    logger.info('[DB] kill query %d' % thread_id)
+                    return
+                except MySQLdb.Error as e:
+                    logger.info('[DB] kill query %d: %s' % (thread_id, e))
+                    if not retry or not is_gone_away(e):
+                        return
+                    self._side_conn = None
+
+    def cancel(self, *owners):
+        """stops queries on connections the `owners` threads hold, on every
+        connection in use if none is given"""
+        for thread_id in self._pool.busy_thread_ids(*owners):
+            self.kill_query(thread_id)
+
+    def count_rows(self, query, timeout=None, use_cache=True):
+        """exact count of `query`, None if it takes longer than `timeout`"""
+        if use_cache:
+            cached = self._counts.get(query)
+            if cached and time.time() - cached[1] < self.option('count_cache_ttl'):
+                return cached[0]
+        lock = threading.Lock()
+        state = dict(done=False, timed_out=False)
+        with self._pool.connection() as conn:
+            thread_id = conn.thread_id()
+
+            def _timeout():
+                with lock:
+                    # never kill the next user of the connection
+                    if not state['done']:
+                        state['timed_out'] = True
+                        self.kill_query(thread_id)
+
+            timer = threading.Timer(timeout, _timeout) if timeout else None
+            try:
+                if timer is not None:
+                    timer.daemon = True
+                    timer.start()
+                with closing(conn.cursor()) as cursor:
+                    cursor.execute(query)
+                    count = int(cursor.fetchone()[0])
+            except MySQLdb.Error as e:
+                if state['timed_out'] and is_interrupted(e):
+                    logger.info('[DB] count timed out (%ss): %s' %
+                                (timeout, query))
+                    return None
+                raise
+            finally:
+                with lock:
+                    state['done'] = True
+                if timer is not None:
+                    timer.cancel()
+        self._counts[query] = (count, time.time())
+        return count
+
+    def forget_count(self, query):
+        self._counts.pop(query, None)
+
+    @property
+    def pool_stats(self):
+        return dict(self._pool.stats)
+
+    def close(self):
+        self._pool.close()
+        if self._schema is not None:
+            self._schema.close()
+        with self._side_lock:
+            if self._side_conn is not None:
+                self._side_conn.close()
+                self._side_conn = None
+
+    @property
+    def schema(self):
+        return self._schema
+
+    @property
+    def result_cache(self):
+        return self._results
+
+    def warm_schema(self):
+        if self._schema is not None:
+            self._schema.warm()
+
+    @retry_on_gone_away
+    def table_status(self):
+        return self._status.table_status()
 
+    @retry_on_gone_away
     def show_tables(self):
+        if self._schema is not None:
+            return self._schema.tables()
         with self.new_cursor() as cursor:
             cursor.execute('show tables')
             ret = map(lambda x:x[0], cursor.fetchall())
         return ret
 
+    @property
+    def server_version(self):
+        """(major, minor, patch) and whether the server is MariaDB"""
+        if self._version is None:
+            with self.new_cursor() as cursor:
+                cursor.execute('select version()')
+                version = cursor.fetchone()[0]
+            numbers = re.match(r'(\d+)\.(\d+)\.(\d+)', version)
+            self._version = (tuple(int(x) for x in numbers.groups())
+                             if numbers else (0, 0, 0),
+                             'mariadb' in version.lower())
+        return self._version
+
+    def explain(self, query, analyze=False, stats=NO_STATS):
+        """text of EXPLAIN FORMAT=JSON, or of EXPLAIN ANALYZE which runs
+        the query (MySQL 8.0.18+)"""
+        query = query.strip().rstrip(';').rstrip()
+        if analyze:
+            version, mariadb = self.server_version
+            if mariadb or version < (8, 0, 18):
+                raise ExplainError('EXPLAIN ANALYZE needs MySQL 8.0.18+')
+            sql = 'explain analyze %s' % query
+        else:
+            sql = 'explain format=json %s' % query
+        rows, _ = self._select(sql, stats=stats)
+        return '\n'.join(row[0] for row in rows)
+
     def get_table(self, name):
-        return Table(self._config, name)
+        return Table(self._config, name, pool=self._pool,
+                     options=self._options, schema=self._schema,
+                     results=self._results)
 
+    @retry_on_gone_away
     def show_databases(self):
         with self.new_cursor() as cursor:
             cursor.execute('show databases')
@@ -59,29 +461,158 @@ class Database(_Connectable):
 
 class Table(_Connectable):
 
-    def __init__(self, config, name):
-        super(Table, self).__init__(config)
+    def __init__(self, config, name, pool=None, options=None, schema=None,
+                 results=None):
+        super(Table, self).__init__(config, pool=pool, options=options)
         self.name = name
-        self._desc = None
+        self.result_cache = results
+        self._schema = schema
+        self._desc = schema.columns(name) if schema is not None else None
+        self._seek_key = None
+
+    @property
+    def select_list(self):
+        """`*` or the columns with large values cut to preview_length"""
+        n = self.option('preview_length')
+        if not n:
+            return '*'
+        keys = self.seek_key
+        large = set(x['name'] for x in self.desc
+                    if x['name'] not in keys and _LARGE_TYPE.match(x['type']))
+        if not large:
+            return '*'
+        columns = []
+        for x in self.desc:
+            c = quote_identifier(x['name'])
+            if x['name'] in large:
+                c = 'if(char_length(%s) > %d, concat(left(%s, %d), \'...\'), ' \
+                    '%s) as %s' % (c, n, c, n, c, c)
+            columns.append(c)
+        return ', '.join(columns)
+
+    def indexed(self, column):
+        """the column leads an index, so the server can sort by it"""
+        return any(x['name'] == column and x['key'] in ('PRI', 'UNI', 'MUL')
+                   for x in self.desc)
+
+    def order_clause(self, order_by):
+        """` order by ...` for (column, descending), ties are broken by the key"""
+        if order_by is None:
+            return ''
+        column, descending = order_by
+        direction = 'desc' if descending else 'asc'
+        columns = [column] + [x for x in self.seek_key if x != column]
+        return ' order by %s' % ', '.join(
+            '%s %s' % (quote_identifier(x), direction) for x in columns)
+
+    @retry_on_gone_away
+    def simple_list(self, offset=0, limit=100, order_by=None, stats=NO_STATS):
+        rows, description = self._select(
+            'select %s from %s%s limit %d offset %d' %
+            (self.select_list, self.name, self.order_clause(order_by), limit,
+             offset), stats=stats)
+        rows = RowConverter.of(description).convert(rows)
+        stats.mark('fetch')
+        return rows
+
+    @retry_on_gone_away
+    def get_row(self, key=None, offset=0, order_by=None):
+        """the full values of a row by its seek key, or by the offset of a
+        table without any key, [(name, value), ...] or None if it is gone"""
+        if key is not None:
+            sql = 'select * from %s where %s' % (self.name, ' and '.join(
+                '%s = %%s' % quote_identifier(x) for x in self.seek_key))
+            params = tuple(key)
+        else:
+            sql = 'select * from %s%s limit 1 offset %d' % \
+                (self.name, self.order_clause(order_by), offset)
+            params = None
+        with self.new_cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            names = [x[0] for x in cursor.description or ()]
+        if row is None:
+            return None
+        return list(zip(names, row))
+
+    def estimated_count(self):
+        info = self._schema.table_info(self.name) \
+            if self._schema is not None else None
+        if info and info.get('rows') is not None:
+            return info['rows']
+        return self.estimate_rows('select * from %s' %
+                                  quote_identifier(self.name))
+
+    @property
+    def count_query(self):
+        return 'select count(*) from %s' % quote_identifier(self.name)
+
+    @retry_on_gone_away
+    def seek_list(self, limit=100, after=None, before=None, since=None,
+                  offset=0, stats=NO_STATS):
+        key = self.seek_key
+        order = 'asc'
+        cond, params = None, None
+        if after is not None:
+            cond, params = keyset_condition(key, after, '>')
+        elif since is not None:
+            cond, params = keyset_condition(key, since, '>=')
+        elif before is not None:
+            cond, params = keyset_condition(key, before, '<')
+            order = 'desc'
+        sql = 'select %s from %s%s order by %s limit %d' % \
+            (self.select_list, self.name, ' where %s' % cond if cond else '',
+             ', '.join('%s %s' % (quote_identifier(x), order) for x in key),
+             limit)
+        if offset:
+            sql += ' offset %d' % offset
+        names = [x['name'] for x in self.desc]
+        positions = [names.index(x) for x in key]
+        raw, description = self._select(sql, params, stats=stats)
+        raw = list(raw)
+        if order == 'desc':
+            raw.reverse()
+        keys = [tuple(values[i] for i in positions) for values in raw]
+        rows = RowConverter.of(description).convert(raw)
+        stats.mark('fetch')
+        return rows, keys
+
+    @property
+    def seek_key(self):
+        """columns of the primary key or a not null unique key, empty if none"""
+        if self._seek_key is None:
+            pk = tuple(x['name'] for x in self.desc if x['key'] == 'PRI')
+            # desc lists columns in table order, ask the index for key order
+            self._seek_key = pk if len(pk) == 1 else self._unique_index()
+            logger.info('[DB] seek key of %s: %s' % (self.name,
+                                                     self._seek_key))
+        return self._seek_key
 
-    def simple_list(self, offset=0, limit=100):
+    @retry_on_gone_away
+    def _unique_index(self):
+        indexes = {}
         with self.new_cursor() as cursor:
-            cursor.execute('select * from %s limit %d offset %d' % \
-                           (self.name, limit, offset))
-            dest = []
-            for values in iter(cursor):
-                col = []
-                for v in values:
-                    col.append(value_optimize(v))
-                dest.append(col)
-        return dest
+            cursor.execute('show index from %s' % self.name)
+            for c in iter(cursor):
+                non_unique, key_name, seq, column, null = \
+                    c[1], c[2], c[3], c[4], c[9]
+                if not non_unique:
+                    indexes.setdefault(key_name, []).append(
+                        (seq, column, null == 'YES'))
+        candidates = sorted(indexes.items(),
+                            key=lambda x:(x[0] != 'PRIMARY', len(x[1]), x[0]))
+        for key_name, columns in candidates:
+            if not any(x[2] for x in columns):
+                return tuple(x[1] for x in sorted(columns))
+        return ()
 
     @property
+    @retry_on_gone_away
     def desc(self):
         if not self._desc:
             with self.new_cursor() as cursor:
                 cursor.execute('desc %s' % self.name)
-                self._desc = []
+                desc = []
                 for c in iter(cursor):
                     data = dict(
                      name = c[0],
@@ -91,6 +622,9 @@ class Table(_Connectable):
                      default = c[4] or 'NULL',
                      extra = c[5]
                 )
-                    self._desc.append(data)
+                    desc.append(data)
+            self._desc = desc
+            if self._schema is not None:
+                self._schema.put_columns(self.name, desc)
         return self._desc
 
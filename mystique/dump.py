@@ -0,0 +1,328 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import io
+import os
+import sys
+import gzip
+import time
+import shutil
+import multiprocessing
+from Queue import Empty
+from contextlib import closing
+import MySQLdb
+import MySQLdb.cursors
+from mystique import export
+from mystique.db import quote_identifier
+from mystique.log import logger
+
+
+class DumpError(Exception):
+    pass
+
+
+def shard_path(path, idx):
+    """out.csv.gz => out.00003.csv.gz"""
+    base, ext = path, ''
+    if base.lower().endswith('.gz'):
+        base, ext = base[:-3], base[-3:]
+    base, ext2 = os.path.splitext(base)
+    return '%s.%05d%s%s' % (base, idx, ext2, ext)
+
+
+def _int_or_none(v):
+    try:
+        return int(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Chunk(object):
+
+    def __init__(self, idx, low, high, path, header):
+        self.idx = idx
+        self.low = low # inclusive, None for the first chunk
+        self.high = high # exclusive, None for the last chunk
+        self.path = path
+        self.header = header
+
+
+def _worker(wid, connect_args, table, key, fmt, compress, batch_size,
+            tasks, results):
+    """runs in a child process, one connection (and snapshot) per worker"""
+    stats = dict(wid=wid, chunks=0, rows=0, busy=0.0)
+    try:
+        conn = MySQLdb.connect(**connect_args)
+        with closing(conn.cursor()) as cursor:
+            cursor.execute('set session transaction isolation level '
+                           'repeatable read')
+            cursor.execute('start transaction with consistent snapshot')
+        results.put(('ready', wid, None))
+        while True:
+            chunk = tasks.get()
+            if chunk is None:
+                break
+            started_at = time.time()
+            rows = _dump_chunk(conn, table, key, chunk, fmt, compress,
+                               batch_size)
+            stats['chunks'] += 1
+            stats['rows'] += rows
+            stats['busy'] += time.time() - started_at
+            results.put(('chunk', wid, (chunk.idx, rows)))
+        conn.close()
+    except Exception as e:
+        results.put(('error', wid, '%s: %s' % (e.__class__.__name__, e)))
+        return
+    results.put(('exit', wid, stats))
+
+
+def _dump_chunk(conn, table, key, chunk, fmt, compress, batch_size):
+    cond, params = [], []
+    if chunk.low is not None:
+        cond.append('%s >= %%s' % quote_identifier(key))
+        params.append(chunk.low)
+    if chunk.high is not None:
+        cond.append('%s < %%s' % quote_identifier(key))
+        params.append(chunk.high)
+    sql = 'select * from %s%s order by %s' % \
+        (quote_identifier(table),
+         ' where %s' % ' and '.join(cond) if cond else '',
+         quote_identifier(key))
+    rows = 0
+    opener = gzip.open if compress else io.open
+    with closing(conn.cursor(MySQLdb.cursors.SSCursor)) as cursor:
+        cursor.execute(sql, params or None)
+        names = tuple(x[0] for x in cursor.description)
+        with opener(chunk.path, 'wb') as out:
+            writer = export.new_writer(fmt, out, names, header=chunk.header)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                writer.write(batch)
+                rows += len(batch)
+    return rows
+
+
+class TableDumper(object):
+    """Dumps a table by ranges of its integer key with `workers` processes.
+    Workers open their snapshots while the tables are locked by FLUSH
+    TABLES WITH READ LOCK, so every chunk sees the same data. Without the
+    privilege each worker still reads one consistent snapshot of its own."""
+
+    def __init__(self, database, table, path, fmt=None, compress=None,
+                 workers=4, chunks=None, merge=True, lock=True,
+                 batch_size=1000):
+        guessed_fmt, guessed_compress = export.guess_format(path)
+        self.fmt = fmt or guessed_fmt
+        if self.fmt not in export.FORMATS:
+            raise DumpError('Unknown format "%s", one of %s' %
+                            (self.fmt, '|'.join(export.FORMATS)))
+        self.compress = guessed_compress if compress is None else compress
+        self.path = os.path.expanduser(path)
+        self.workers = max(workers, 1)
+        self.chunks = chunks or self.workers * 4
+        self.merge = merge
+        self.lock = lock
+        self.rows = 0
+        self.elapsed = 0.0
+        self.worker_stats = []
+        self.consistent = False
+        self._database = database
+        self._table = database.get_table(table)
+        self._batch_size = batch_size
+
+    def _split(self):
+        key = self._table.seek_key
+        if len(key) != 1:
+            raise DumpError('%s has no single column key to split by' %
+                            self._table.name)
+        key = key[0]
+        with self._database.new_cursor() as cursor:
+            cursor.execute('select min(%s), max(%s) from %s' %
+                           (quote_identifier(key), quote_identifier(key),
+                            quote_identifier(self._table.name)))
+            low, high = cursor.fetchone()
+        low, high = _int_or_none(low), _int_or_none(high)
+        if low is None or high is None:
+            # empty table or a non integer key, dump it as one chunk
+            bounds = [None, None]
+        else:
+            count = max(min(self.chunks, high - low + 1), 1)
+            width = high - low + 1
+            bounds = [None] + [low + width * i // count
+                               for i in range(1, count)] + [None]
+        # merged output keeps only the header of the first chunk
+        return key, [_Chunk(i, bounds[i], bounds[i + 1],
+                            shard_path(self.path, i),
+                            header=i == 0 or not self.merge)
+                     for i in range(len(bounds) - 1)]
+
+    def _lock_tables(self):
+        if not self.lock:
+            return None
+        conn = MySQLdb.connect(**self._database.connect_args)
+        try:
+            with closing(conn.cursor()) as cursor:
+                cursor.execute('flush tables with read lock')
+            return conn
+        except MySQLdb.Error as e:
+            logger.info('[DUMP] can not lock tables, each worker reads '
+                        'its own snapshot: %s' % e)
+            conn.close()
+            return None
+
+    def run(self, progress=None):
+        started_at = time.time()
+        key, chunks = self._split()
+        tasks = multiprocessing.Queue()
+        results = multiprocessing.Queue()
+        workers = min(self.workers, len(chunks))
+        procs = [multiprocessing.Process(
+            target=_worker,
+            args=(i + 1, self._database.connect_args, self._table.name, key,
+                  self.fmt, self.compress, self._batch_size, tasks, results))
+                 for i in range(workers)]
+        lock_conn = self._lock_tables()
+        try:
+            try:
+                for p in procs:
+                    p.daemon = True
+                    p.start()
+                ready = 0
+                while ready < workers:
+                    kind, wid, value = self._result(results, procs)
+                    if kind == 'ready':
+                        ready += 1
+            finally:
+                if lock_conn is not None:
+                    lock_conn.close() # releases the global read lock
+            self.consistent = lock_conn is not None or workers == 1
+            logger.info('[DUMP] %d workers started, %d chunks of %s by %s' %
+                        (workers, len(chunks), self._table.name, key))
+            for chunk in chunks:
+                tasks.put(chunk)
+            for _ in procs:
+                tasks.put(None)
+            done = exited = 0
+            while exited < workers:
+                kind, wid, value = self._result(results, procs)
+                if kind == 'chunk':
+                    done += 1
+                    self.rows += value[1]
+                    self.elapsed = time.time() - started_at
+                    if progress:
+                        progress(self, done, len(chunks))
+                elif kind == 'exit':
+                    exited += 1
+                    self.worker_stats.append(value)
+            for p in procs:
+                p.join()
+        except:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+            self._remove([x.path for x in chunks])
+            raise
+        if self.merge:
+            self._merge([x.path for x in chunks])
+        self.elapsed = time.time() - started_at
+        self.worker_stats.sort(key=lambda x:x['wid'])
+        logger.info('[DUMP] %s' % self.summary)
+        return self.rows
+
+    @classmethod
+    def _result(cls, results, procs):
+        while True:
+            try:
+                kind, wid, value = results.get(timeout=1)
+            except Empty:
+                if not any(p.is_alive() for p in procs):
+                    raise DumpError('all workers have exited')
+                continue
+            if kind == 'error':
+                raise DumpError('worker %d: %s' % (wid, value))
+            return kind, wid, value
+
+    def _merge(self, paths):
+        # gzip members and header-less chunks can simply be concatenated
+        with io.open(self.path, 'wb') as out:
+            for path in paths:
+                with io.open(path, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+        self._remove(paths)
+
+    @classmethod
+    def _remove(cls, paths):
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    @property
+    def rows_per_sec(self):
+        return self.rows / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def summary(self):
+        return '%d rows in %.1fs (%d rows/s)%s' % \
+            (self.rows, self.elapsed, self.rows_per_sec,
+             '' if self.consistent else ' (snapshots per worker)')
+
+    def report(self):
+        lines = [self.summary]
+        for x in self.worker_stats:
+            lines.append('  worker %d: %d chunks, %d rows in %.1fs (%d rows/s)' %
+                         (x['wid'], x['chunks'], x['rows'], x['busy'],
+                          x['rows'] / x['busy'] if x['busy'] > 0 else 0))
+        return '\n'.join(lines)
+
+
+def main(argv):
+    """mystique dump [-c CONFIG] [-n NAME] [-d DB] -t TABLE -o PATH
+    [-j WORKERS] [--chunks N] [--shards] [--no-lock]"""
+    import argparse
+    from mystique import config
+    from mystique.db import Database
+    parser = argparse.ArgumentParser(
+        prog='mystique dump',
+        description='dump a table with parallel worker processes')
+    parser.add_argument('-d', '--db', type=str, help='the database name')
+    parser.add_argument('-c', '--config', type=str, help='a path to config file')
+    parser.add_argument('-n', '--name', type=str, help='the name of connection alias')
+    parser.add_argument('-t', '--table', type=str, required=True,
+                        help='a table to dump')
+    parser.add_argument('-o', '--output', type=str, required=True,
+                        help='a path to write, shards are numbered from it')
+    parser.add_argument('-f', '--format', type=str, choices=export.FORMATS,
+                        help='csv, tsv or jsonl (default: by the extension)')
+    parser.add_argument('-z', '--gzip', action='store_true', default=None,
+                        help='compress with gzip (default: by the extension)')
+    parser.add_argument('-j', '--workers', type=int, default=4)
+    parser.add_argument('--chunks', type=int, help='default: workers * 4')
+    parser.add_argument('--shards', action='store_true',
+                        help='keep a file per chunk instead of merging them')
+    parser.add_argument('--no-lock', action='store_true',
+                        help='do not use FLUSH TABLES WITH READ LOCK')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000)
+    parser.add_argument('-q', '--quiet', action='store_true')
+    opts = parser.parse_args(argv)
+
+    def _progress(dumper, done, total):
+        sys.stderr.write('\r%d/%d chunks, %s' % (done, total, dumper.summary))
+        sys.stderr.flush()
+
+    database = Database(**config.load_config(opts))
+    try:
+        dumper = TableDumper(database, opts.table, opts.output,
+                             fmt=opts.format, compress=opts.gzip,
+                             workers=opts.workers, chunks=opts.chunks,
+                             merge=not opts.shards, lock=not opts.no_lock,
+                             batch_size=opts.batch_size)
+        dumper.run(progress=None if opts.quiet else _progress)
+    except DumpError as e:
+        sys.stderr.write('%s\n' % e)
+        return 1
+    finally:
+        database.close()
+    if not opts.quiet:
+        sys.stderr.write('\n%s\n' % dumper.report())
+    return 0
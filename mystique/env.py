@@ -8,3 +8,5 @@ MYSTIQUE_ENV_CONFIG_FILE = os.environ.get('MYSTIQUE_CONFIG')
 MYSTIQUE_ENV_LOG_DEBUG = os.environ.get('MYSTIQUE_LOG_DEBUG') == '1'
 
 MYSTIQUE_ENV_LOG_FILE = os.environ.get('MYSTIQUE_LOG_FILE')
+
+MYSTIQUE_ENV_STARTUP_TRACE = os.environ.get('MYSTIQUE_STARTUP_TRACE') == '1'
@@ -0,0 +1,177 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import re
+import json
+from collections import OrderedDict
+
+
+COLUMNS = ('plan', 'access', 'key', 'rows', 'cost', 'note')
+
+# operations wrapping the tables of a query block in FORMAT=JSON
+_OPERATIONS = OrderedDict((
+    ('ordering_operation', 'order'),
+    ('grouping_operation', 'group'),
+    ('duplicates_removal', 'distinct'),
+    ('windowing', 'window'),
+    ('buffer_result', 'buffer'),
+    ('union_result', 'union'),
+))
+
+_FULL_SCANS = {'ALL': 'full scan', 'index': 'full index scan'}
+
+_ANALYZE_LINE = re.compile(
+    r'^(?P<indent> *)-> (?P<label>.*?)'
+    r'(?:  \(cost=(?P<cost>[\d.e+]+) rows=(?P<rows>[\d.e+]+)\))?'
+    r'(?: \(actual time=(?P<time>[\d.]+\.\.[\d.]+) rows=(?P<actual>[\d.]+)'
+    r' loops=(?P<loops>\d+)\))?'
+    r'(?: \(never executed\))?$')
+
+_ANALYZE_WARNINGS = (('Table scan', 'full scan'),
+                     ('Index scan', 'full index scan'),
+                     ('Sort', 'filesort'))
+
+
+class ExplainError(Exception):
+    pass
+
+
+class PlanNode(object):
+
+    def __init__(self, label, access='', key='', rows='', cost='', notes=(),
+                 warning=False, children=None):
+        self.label = label
+        self.access = access
+        self.key = key
+        self.rows = rows
+        self.cost = cost
+        self.notes = list(notes)
+        self.warning = warning # full scans and filesorts
+        self.children = children or []
+
+
+def _str(v):
+    # names and messages are unicode from json.loads
+    if v is None:
+        return ''
+    return v if isinstance(v, basestring) else str(v)
+
+
+def _nodes(obj):
+    """plan nodes found under a json object, in the order of the plan"""
+    nodes = []
+    for key, value in obj.items():
+        if key == 'query_block':
+            nodes.append(_block_node(value))
+        elif key == 'table':
+            nodes.append(_table_node(value))
+        elif key in _OPERATIONS:
+            nodes.append(_operation_node(key, value))
+        elif isinstance(value, list):
+            # nested_loop, query_specifications, *_subqueries
+            for x in value:
+                if isinstance(x, dict):
+                    nodes.extend(_nodes(x))
+        elif isinstance(value, dict):
+            nodes.extend(_nodes(value))
+    return nodes
+
+
+def _block_node(block):
+    notes = [block['message']] if 'message' in block else []
+    return PlanNode('select #%s' % _str(block.get('select_id')),
+                    cost=_str(block.get('cost_info', {}).get('query_cost')),
+                    notes=notes, children=_nodes(block))
+
+
+def _table_node(table):
+    access = table.get('access_type', '')
+    cost_info = table.get('cost_info', {})
+    notes = []
+    if access in _FULL_SCANS:
+        notes.append(_FULL_SCANS[access])
+    if table.get('using_index'):
+        notes.append('using index')
+    filtered = table.get('filtered')
+    if filtered is not None and float(filtered) < 100:
+        notes.append('filtered %s%%' % filtered)
+    if 'message' in table:
+        notes.append(table['message'])
+    return PlanNode(table.get('table_name', '?'), access=access,
+                    key=_str(table.get('key')),
+                    rows=_str(table.get('rows_examined_per_scan')),
+                    cost=_str(cost_info.get('prefix_cost') or
+                              cost_info.get('read_cost')),
+                    notes=notes, warning=access in _FULL_SCANS,
+                    children=_nodes(table))
+
+
+def _operation_node(key, op):
+    notes = []
+    if op.get('using_filesort'):
+        notes.append('filesort')
+    if op.get('using_temporary_table'):
+        notes.append('temporary')
+    return PlanNode(_OPERATIONS[key], access=op.get('access_type', ''),
+                    cost=_str(op.get('cost_info', {}).get('sort_cost')),
+                    notes=notes, warning=bool(op.get('using_filesort')),
+                    children=_nodes(op))
+
+
+def parse_json_plan(text):
+    """root node of EXPLAIN FORMAT=JSON"""
+    doc = json.loads(text, object_pairs_hook=OrderedDict)
+    nodes = _nodes(doc)
+    return nodes[0] if len(nodes) == 1 else PlanNode('query', children=nodes)
+
+
+def parse_analyze(text):
+    """root node of the tree printed by EXPLAIN ANALYZE (or FORMAT=TREE)"""
+    root = PlanNode('query')
+    stack = [(-1, root)]
+    for line in text.splitlines():
+        m = _ANALYZE_LINE.match(line)
+        if m is None:
+            if line.strip() and len(stack) > 1:
+                stack[-1][1].label += ' ' + line.strip() # wrapped condition
+            continue
+        notes = []
+        if m.group('time'):
+            notes.append('actual %sms x%s' % (m.group('time').split('..')[1],
+                                              m.group('loops')))
+        elif line.endswith('(never executed)'):
+            notes.append('never executed')
+        label = m.group('label')
+        warnings = [w for prefix, w in _ANALYZE_WARNINGS
+                    if label.startswith(prefix)]
+        rows = m.group('actual') or m.group('rows') or ''
+        if m.group('actual') and m.group('rows'):
+            rows = '%s (~%s)' % (m.group('actual'), m.group('rows'))
+        node = PlanNode(label, rows=rows, cost=m.group('cost') or '',
+                        notes=warnings + notes, warning=bool(warnings))
+        depth = len(m.group('indent'))
+        while stack[-1][0] >= depth:
+            stack.pop()
+        stack[-1][1].children.append(node)
+        stack.append((depth, node))
+    if len(root.children) == 1:
+        return root.children[0]
+    return root
+
+
+def flatten(root):
+    """rows of COLUMNS with the tree drawn in the plan column, and the
+    indexes of the rows to be highlighted"""
+    rows, warnings = [], set()
+
+    def _walk(node, prefix, last, top):
+        if node.warning:
+            warnings.add(len(rows))
+        branch = '' if top else ('`- ' if last else '|- ')
+        rows.append(('%s%s%s' % (prefix, branch, node.label), node.access,
+                     node.key, node.rows, node.cost, ', '.join(node.notes)))
+        child_prefix = prefix if top else prefix + ('   ' if last else '|  ')
+        for i, child in enumerate(node.children):
+            _walk(child, child_prefix, i == len(node.children) - 1, False)
+
+    _walk(root, '', True, True)
+    return rows, warnings
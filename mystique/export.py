@@ -0,0 +1,231 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import io
+import os
+import sys
+import csv
+import gzip
+import json
+import time
+import threading
+from mystique.log import logger
+
+
+FORMATS = ('csv', 'tsv', 'jsonl')
+
+
+class ExportError(Exception):
+    pass
+
+
+def _text(v):
+    if v is None or isinstance(v, basestring):
+        return v
+    return str(v)
+
+
+def _utf8(v):
+    if v is None:
+        return ''
+    if isinstance(v, unicode):
+        return v.encode('utf8')
+    return v if isinstance(v, str) else str(v)
+
+
+def _json_value(v):
+    if v is None or isinstance(v, (bool, int, long, float, unicode)):
+        return v
+    if isinstance(v, str):
+        return v.decode('utf8', 'replace')
+    return str(v) # decimal, datetime, ...
+
+
+class _CsvWriter(object):
+
+    delimiter = ','
+
+    def __init__(self, out, names, header=True):
+        self._writer = csv.writer(out, delimiter=self.delimiter,
+                                  lineterminator='\n')
+        if header:
+            self._writer.writerow([_utf8(x) for x in names])
+
+    def write(self, rows):
+        self._writer.writerows([[_utf8(v) for v in values]
+                                for values in rows])
+
+
+class _TsvWriter(_CsvWriter):
+
+    delimiter = '\t'
+
+
+class _JsonLinesWriter(object):
+
+    def __init__(self, out, names, header=True):
+        self._out = out
+        self._names = [_json_value(_text(x)) for x in names]
+
+    def write(self, rows):
+        names = self._names
+        self._out.write(''.join(
+            '%s\n' % json.dumps(dict(zip(names, [_json_value(v)
+                                                 for v in values])))
+            for values in rows))
+
+
+_WRITERS = dict(csv=_CsvWriter, tsv=_TsvWriter, jsonl=_JsonLinesWriter)
+
+
+def new_writer(fmt, out, names, header=True):
+    """`write(rows)` of the format, csv and tsv start with a header line"""
+    return _WRITERS[fmt](out, names, header=header)
+
+
+def guess_format(path, default='csv'):
+    """format and compression by the file name, foo.jsonl.gz => jsonl, True"""
+    name = (path or '').lower()
+    compress = name.endswith('.gz')
+    if compress:
+        name = name[:-len('.gz')]
+    ext = os.path.splitext(name)[1].lstrip('.')
+    return (ext if ext in FORMATS else default), compress
+
+
+class Exporter(object):
+    """Streams the result of `query` to a file (or stdout when `path` is
+    None or '-') through a server-side cursor, `batch_size` rows at a time.
+    `progress` is called with the exporter at most every `interval` secs."""
+
+    def __init__(self, database, query, path=None, fmt=None, compress=None,
+                 batch_size=1000, progress=None, interval=0.5):
+        guessed_fmt, guessed_compress = guess_format(path)
+        self.fmt = fmt or guessed_fmt
+        if self.fmt not in FORMATS:
+            raise ExportError('Unknown format "%s", one of %s' %
+                              (self.fmt, '|'.join(FORMATS)))
+        self.path = path if path and path != '-' else None
+        self.compress = guessed_compress if compress is None else compress
+        self.rows = 0
+        self.started_at = None
+        self.finished_at = None
+        self._database = database
+        self._query = query
+        self._batch_size = batch_size
+        self._progress = progress
+        self._interval = interval
+        self._cancelled = threading.Event()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def rows_per_sec(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _open(self):
+        if self.path is None:
+            out = sys.stdout
+            if self.compress:
+                return gzip.GzipFile(fileobj=out, mode='wb'), True
+            return out, False
+        path = os.path.expanduser(self.path)
+        if self.compress:
+            return gzip.open(path, 'wb'), True
+        return io.open(path, 'wb'), True
+
+    def run(self):
+        self.started_at = time.time()
+        logger.info('[EXPORT] %s => %s (%s%s)' %
+                    (self._query, self.path or 'stdout', self.fmt,
+                     '.gz' if self.compress else ''))
+        stream = self._database.open_stream(self._query, server_side=True)
+        out, close_out = None, False
+        try:
+            out, close_out = self._open()
+            writer = new_writer(self.fmt, out, stream.description)
+            last = 0
+            while not self.cancelled:
+                rows = stream.fetch(self._batch_size)
+                if not rows:
+                    break
+                writer.write(rows)
+                self.rows += len(rows)
+                if self._progress and time.time() - last >= self._interval:
+                    last = time.time()
+                    self._progress(self)
+        finally:
+            stream.close()
+            if out is not None:
+                if close_out:
+                    out.close()
+                else:
+                    out.flush()
+            self.finished_at = time.time()
+        logger.info('[EXPORT] %s' % self.summary)
+        if self._progress:
+            self._progress(self)
+        return self.rows
+
+    @property
+    def summary(self):
+        return '%d rows in %.1fs (%d rows/s)%s' % \
+            (self.rows, self.elapsed, self.rows_per_sec,
+             ' cancelled' if self.cancelled else '')
+
+
+def main(argv):
+    """mystique export [-c CONFIG] [-n NAME] [-d DB] (-t TABLE | -e QUERY)
+    [-o PATH] [-f FORMAT] [-z]"""
+    import argparse
+    from mystique import config
+    from mystique.db import Database, quote_identifier
+    parser = argparse.ArgumentParser(prog='mystique export',
+                                     description='export a table or a query')
+    parser.add_argument('-d', '--db', type=str, help='the database name')
+    parser.add_argument('-c', '--config', type=str, help='a path to config file')
+    parser.add_argument('-n', '--name', type=str, help='the name of connection alias')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('-t', '--table', type=str, help='a table to export')
+    target.add_argument('-e', '--execute', type=str, help='a query to export')
+    parser.add_argument('-o', '--output', type=str, default='-',
+                        help='a path to write (default: stdout)')
+    parser.add_argument('-f', '--format', type=str, choices=FORMATS,
+                        help='csv, tsv or jsonl (default: by the extension)')
+    parser.add_argument('-z', '--gzip', action='store_true', default=None,
+                        help='compress with gzip (default: by the extension)')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000)
+    parser.add_argument('-q', '--quiet', action='store_true')
+    opts = parser.parse_args(argv)
+
+    query = opts.execute or 'select * from %s' % quote_identifier(opts.table)
+
+    def _progress(exporter):
+        sys.stderr.write('\r%s' % exporter.summary)
+        sys.stderr.flush()
+
+    database = Database(**config.load_config(opts))
+    exporter = Exporter(database, query, path=opts.output, fmt=opts.format,
+                        compress=opts.gzip, batch_size=opts.batch_size,
+                        progress=None if opts.quiet else _progress)
+    try:
+        exporter.run()
+    except KeyboardInterrupt:
+        exporter.cancel()
+        return 130
+    finally:
+        database.close()
+        if not opts.quiet:
+            sys.stderr.write('\n')
+    return 0
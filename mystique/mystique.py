@@ -1,14 +1,19 @@
 # -*- encoding:utf8 -*-
 from __future__ import absolute_import
+import sys
+import time
+import threading
 import urwid
 import blinker
 import mystique
-from mystique import config
-from mystique.db import Database, Table
-from mystique.session import TableSession, FreeQuerySession
+from mystique import config, env, startup, util
 from mystique.log import logger
-from mystique.widgets import AppendableColumns, StupidButton, \
-TableFilter, TableColumn, txt, ftxt, fstxt, get_original_widget
+from mystique.worker import BackgroundWorker
+from mystique.widgets import AppendableColumns, \
+TableFilter, TableColumn, Prompt, Debouncer, txt, ftxt, fstxt, \
+get_original_widget
+from mystique.widgets.resultlist import ResultWalker
+from mystique.widgets.tablelist import TableListWalker
 from mystique.widgets.queryeditor import QueryEditor, with_word_type, AcWordTypes
 
 
@@ -26,7 +31,9 @@ palette = [
     ('buttn-3','light red','black'),
     ('buttnf','dark blue','yellow','bold'),
     ('col_head', 'dark green', 'black', 'bold'),
+    ('warn_row', 'light red', 'light gray', 'bold'),
     ('error_message','light red','white'),
+    ('notice_message','white','dark blue'),
     ('kb_desc_cmd', 'yellow', 'dark blue')
 ]
 
@@ -45,7 +52,25 @@ _kb_lr_pager = (
     ('j', 'Prev')
 )
 
+_kb_count = (
+    ('c', 'Count'),
+    ('p', 'Page'),
+    ('e', 'Export')
+)
+
+_kb_search = (
+    ('/', 'Search'),
+    ('n(N)', 'Match'),
+    ('o', 'Sort'),
+    ('i', 'Stats')
+)
+
+_kb_cancel = (
+    ('esc(ctrl+c)', 'Cancel'),
+)
+
 keybinds = {
+    'keypress_while_loading' : _kb_quit_on_q,
     'keypress_default' : (
         ('x', 'Query'),
         ('/', 'Filter'),
@@ -54,23 +79,34 @@ keybinds = {
     'keypress_in_table_session' : (
         ('q(Q)', 'Close'),
         ('d', 'Description'),
+        ('enter', 'Row'),
+        ('s', 'Seek'),
+        ('r', 'Refresh'),
         ('x', 'Query'),
         ('ctrl+x', 'Run'),
+        ('ctrl+e(a)', 'Explain(Analyze)'),
         ('esc', 'CloseEditor')
-    ) + _kb_focus_on_g + _kb_lr_pager,
+    ) + _kb_focus_on_g + _kb_lr_pager + _kb_count + _kb_search,
     'keypress_in_table_desc' : (
         ('q(Q)', 'Close'),
     ) + _kb_focus_on_g,
+    'keypress_in_row_detail' : (
+        ('q(Q)', 'Close'),
+    ) + _kb_focus_on_g,
     'keypress_in_editor' : (
         ('ctrl+x', 'Run'),
+        ('ctrl+e(a)', 'Explain(Analyze)'),
         ('esc', 'Close')
     ),
+    'keypress_while_running' : _kb_cancel,
     'keypress_in_query_result' : (
         ('x', 'Query'),
+        ('r', 'Refresh'),
         ('ctrl+x', 'Run'),
+        ('ctrl+e(a)', 'Explain(Analyze)'),
         ('esc', 'CloseEditor'),
         ('q', 'Close')
-    ) + _kb_focus_on_g + _kb_lr_pager
+    ) + _kb_focus_on_g + _kb_lr_pager + _kb_count + _kb_search
 }
 
 
@@ -80,32 +116,58 @@ HEADER_DEFAULT = '%s %s' % (mystique.__mystique__, mystique.__version__)
 class Events(object):
     table_list_rendered = blinker.signal('table_list_rendered')
     table_desc_rendered = blinker.signal('table_desc_rendered')
+    table_row_rendered = blinker.signal('table_row_rendered')
     table_values_rendered = blinker.signal('table_values_rendered')
     query_editor_opened = blinker.signal('query_editor_opened')
     query_result_rendered = blinker.signal('query_result_rendered')
     keybind_changed = blinker.signal('keybind_changed')
+    # sent with a stats.QueryStats, see there
+    query_started = blinker.signal('query_started')
+    query_finished = blinker.signal('query_finished')
 
 
 class MystiqueView(urwid.Frame):
 
     __max_width_each_column = 30
 
+    __progress_interval = 0.2
+
+    __filter_delay = 0.08
+
     def __init__(self, conf):
         self._config = conf
-        self._database = Database(**conf)
-        self._table_list = self._database.show_tables()
+        self._database = None # connected in background by load()
+        self._table_list = []
 
-        self.information_text1 = txt(self._database.connection_string)
+        self.information_text1 = txt('%s@%s:%s %s' % (
+            conf.get('user'), conf.get('host'), conf.get('port'),
+            conf.get('db')))
         self.information_text2 = txt('')
         self.footer_columns = AppendableColumns([])
         self.listbox = urwid.ListBox(urwid.SimpleListWalker([]))
         self.query_editor = None
-        self.table_filter = TableFilter(word_list=self._table_list,
-                                        autocompleted=self._do_table_filter,
-                                        match_partical=True)
-        self._keypress_handler = self.keypress_default
+        self.prompt = None
+        self._filter_debouncer = Debouncer(self.__filter_delay)
+        self.table_filter = None
+        self._table_walker = None
+        self._keypress_handler = self.keypress_while_loading
         self._table_session = None
+        self._session = None
+        self._column_offset = 0
+        self._sort = None # (column, descending) of rows sorted on screen
+        self._search = None # (text, walker, matching positions)
+        self._found_row = None # row to focus on the page being read
+        self._analyze_confirmed = None # (key, query) EXPLAIN ANALYZE is asked by
         self._current_focus_on_tablelist = 0
+        self._worker = BackgroundWorker()
+        # counts may take seconds, they never hold up fetching pages
+        self._counter = BackgroundWorker(name='mystique-counter')
+        self._counted_session = None
+        self._export_worker = BackgroundWorker(name='mystique-export')
+        self._exporter = None
+        self._loop = None
+        self._running = None # (session, started at, keypress handler)
+        self._cancel_requested = False
 
         super(MystiqueView, self).__init__(
             self.listbox,
@@ -117,80 +179,372 @@ class MystiqueView(urwid.Frame):
             footer = urwid.AttrWrap(self.footer_columns, 'footer')
         )
 
+        self.clear_listbox(body=[txt('Loading tables of %s ...' %
+                                     conf.get('db'))])
+        self._change_keybinds(self.keypress_while_loading)
+
+    def attach(self, loop):
+        self._loop = loop
+        self._worker.attach(loop)
+        self._counter.attach(loop)
+        self._export_worker.attach(loop)
+        self._filter_debouncer.attach(loop)
+
+    def load(self):
+        """connects and reads the table list off the UI thread"""
+        def _connect():
+            from mystique.db import Database # MySQLdb is loaded here
+            database = Database(**self._config)
+            return database, database.show_tables()
+
+        def _failed(e):
+            self.clear_listbox(body=[txt('Can not load tables of %s' %
+                                         self._config.get('db'))])
+            self.render_error(self._error_message(e))
+
+        self._worker.submit(_connect, callback=self._on_loaded,
+                            errback=_failed)
+
+    def _on_loaded(self, result):
+        self._database, self._table_list = result
+        startup.mark('connect')
+        self.information_text1.set_text(self._database.connection_string)
+        self.table_filter = TableFilter(word_list=self._table_list,
+                                        autocompleted=self._do_table_filter,
+                                        match_partical=True,
+                                        debouncer=self._filter_debouncer)
+        self._table_walker = TableListWalker(
+            self._table_list,
+            lambda b:self._start_table_session(b.get_label()))
         self.render_table_list()
+        self._worker.submit(self._database.table_status,
+                            callback=self._table_walker.set_status)
+        # one bulk fetch of columns instead of a desc per table
+        self._worker.submit(self._database.warm_schema)
+
+    def close(self):
+        if self._exporter is not None:
+            self._exporter.cancel()
+        self._set_session(None)
+        if self._database is not None:
+            self._database.close()
 
     @property
     def db_name(self):
-        return self._database.config('db')
+        return self._config.get('db')
 
     def _start_table_session(self, table):
+        from mystique.session import TableSession
         self._current_focus_on_tablelist = self.listbox.focus_position
         logger.info('table=[%s] is choosen (focus: %d)' %
                     (table, self._current_focus_on_tablelist))
-        self._session = TableSession(self._database.get_table(table))
-        if self.render_table_values():
-            self._change_keybinds(self.keypress_in_table_session)
-        Events.table_values_rendered.send(self)
+        self._set_session(TableSession(self._database.get_table(table)))
+        self.render_table_values(on_success=self.keypress_in_table_session)
+
+    def _set_session(self, session):
+        if self._session is not None and self._session is not session:
+            self._worker.cancel_pending()
+            self._counter.cancel_pending()
+            # a count of the session may hold a connection for long
+            self._cancel_queries(self._counter)
+            if self.query_editor is not None:
+                # column loads of the editor may be among them
+                self.query_editor.forget_column_requests()
+            self._session.close()
+            self._column_offset = 0
+            self._sort = None
+            self._search = None
+            self._found_row = None
+        self._session = session
+
+    def _prefetch(self):
+        session = self._session
+        depth = self._database.option('prefetch_depth')
+        if session is None or depth <= 0:
+            return
+        self._worker.submit(lambda:session.prefetch(depth),
+                            callback=lambda n:self._on_prefetched(session, n))
+
+    def _on_prefetched(self, session, fetched):
+        logger.debug('prefetched %d page(s): %s' % (fetched, session))
+        if fetched and session is self._session:
+            self.update_information('%s (+%d)' % (session, fetched))
+
+    def _count_total(self, session, exact=False, use_cache=True):
+        """an estimate at once, then the exact count if asked"""
+        self._counted_session = session
+        if session.total is None:
+            self._counter.submit(session.estimate_total,
+                                 callback=lambda n:self._on_counted(session, n))
+        query = session.count_query
+        if exact and query is not None:
+            timeout = self._database.option('count_timeout')
+            self._counter.submit(
+                lambda:self._database.count_rows(query, timeout=timeout,
+                                                 use_cache=use_cache),
+                callback=lambda n:self._on_counted(session, n, exact=True),
+                errback=lambda e:self._on_count_failed(session, e))
+
+    def _on_counted(self, session, count, exact=False):
+        if session is not self._session:
+            return # switched while counting
+        if count is None:
+            if exact:
+                self.render_error('count(*) timed out')
+            return
+        session.set_total(count, exact=exact)
+        if session is self._session and self._running is None and \
+            self._keypress_handler in (self.keypress_in_table_session,
+                                       self.keypress_in_query_result):
+                self.update_information(str(session))
+
+    def _on_count_failed(self, session, e):
+        # not when it is cancelled with the page read or left behind
+        if session is self._session and session is self._counted_session:
+            self.render_error(self._error_message(e))
+
+    def open_page_prompt(self):
+        count = self.session.page_count
+        if count is None:
+            self.render_error('number of pages is unknown yet')
+            return
+        self.open_prompt('page (1-%s%d): ' %
+                         ('' if self.session.total_exact else '~', count),
+                         self._jump_to_page)
+
+    def _jump_to_page(self, text):
+        try:
+            page = int(text)
+        except ValueError:
+            self.render_error('not a page number: %s' % text)
+            return
+        if page < 1:
+            self.render_error('not a page number: %s' % text)
+            return
+        count = self.session.page_count
+        if count is not None and page > count:
+            self.render_error('page %d is past the last page (%s%d)' %
+                              (page, '' if self.session.total_exact else '~',
+                               count))
+            return
+        self.session.jump(page)
+        self.render_table_values()
+
+    def open_export_prompt(self):
+        from mystique import export
+        if self._session.export_query is None:
+            self.render_error('nothing to export')
+            return
+        if self._exporter is not None:
+            self.render_error('export is running: %s' % self._exporter.summary)
+            return
+        self.open_prompt('export to (%s[.gz]): ' % '|'.join(export.FORMATS),
+                         self._export_session)
+
+    def _export_session(self, path):
+        from mystique import export
+        path = path.strip()
+        if not path or path == '-':
+            # stdout is the screen here
+            self.render_error('export needs a file path')
+            return
+        session = self._session
+        try:
+            exporter = export.Exporter(self._database, session.export_query,
+                                       path=path)
+        except export.ExportError as e:
+            self.render_error(str(e))
+            return
+        self._exporter = exporter
+
+        def _done(rows):
+            self._exporter = None
+            self.render_notice('exported to %s: %s' % (path, exporter.summary))
+
+        def _failed(e):
+            self._exporter = None
+            self.render_error('export failed: %s' % self._error_message(e))
+
+        self._export_worker.submit(exporter.run, callback=_done,
+                                   errback=_failed)
+        self._update_export_progress()
+
+    def _update_export_progress(self, loop=None, user_data=None):
+        exporter = self._exporter
+        if exporter is None:
+            return
+        self.render_notice('exporting to %s: %s' % (exporter.path,
+                                                    exporter.summary))
+        if self._loop is not None:
+            self._loop.set_alarm_in(self.__progress_interval,
+                                    self._update_export_progress)
+
+    def render_stats(self):
+        stats = self._session.stats if self._session is not None else None
+        if stats is None:
+            self.render_error('No stats of the page')
+            return
+        self.render_notice(stats.summary)
+
+    def _refresh_session(self):
+        if getattr(self._session, 'analyze', False) and \
+            not self._confirm_analyze('r', self._session.query):
+                return
+        query = self._session.count_query
+        if query is not None:
+            self._database.forget_count(query)
+        self._session.refresh()
+        self._counted_session = None
+        self.render_table_values()
 
     def render_table_list(self):
-        self._session = None
+        self._set_session(None)
         self._change_keybinds(self.keypress_default)
-        self.clear_listbox()
+        walker = self._table_walker
+        walker.clear_top()
+        walker.set_tables(self.table_filter.body.current_list)
+        self._set_listbox(walker)
 
         if not self.table_filter_is_shown and \
             self.table_filter.body.is_active():
                 self.open_table_filter(clear=False) # re-show table filter
 
-        tables = self.table_filter.body.current_list
-        if tables:
-            max_len = max(len(x) for x in tables)
-            new_session = lambda b:self._start_table_session(b.get_label())
-            for t in tables:
-                btn = urwid.AttrWrap(StupidButton(t, new_session),
-                                    'buttn', 'buttnf')
-                btn = urwid.Padding(btn, align='left',
-                                    width=('relative', max_len))
-                self.listbox.body.append(btn)
-            self.listbox.body.set_focus(self._current_focus_on_tablelist)
+        if len(walker):
+            walker.set_focus(min(self._current_focus_on_tablelist,
+                                 len(walker) - 1))
             self._current_focus_on_tablelist = 0
 
         Events.table_list_rendered.send(self)
 
-    def render_table_values(self):
-        try:
-            result_list = self._session.get_list()
-        except Exception as e:
-            logger.error(e)
-            self.render_error('%d: %s' % (e[0] or 0, e[1]))
-            return False
-
-        result_desc = tuple(self._session.result_desc())
-        idx_col_len = len(str(len(result_list) + self._session.offset))
-
-        sizemap = self._update_sizemap(result_desc, {},
-                                       self.__max_width_each_column)
-        for values in result_list:
-            self._update_sizemap(values, sizemap, self.__max_width_each_column)
-
-        names = (ftxt('', idx_col_len),) + \
-            tuple(fstxt(x, sizemap[i]) for i, x in enumerate(result_desc))
-        header = urwid.AttrWrap(TableColumn(names), 'col_head')
-        self.clear_listbox(body=[header])
-
-        for c, values in enumerate(result_list):
-            index_str = str(c + 1 + self._session.offset)
-            line = (ftxt(index_str, idx_col_len),) + \
-                tuple(fstxt(v, sizemap[i]) for i, v in enumerate(values))
-            self.listbox.body.append(TableColumn(line))
+    def render_table_values(self, on_success=None):
+        """fetches the current page off the UI thread and renders it"""
+        session = self._session
+        if self._running is not None:
+            return
+        self._running = (session, time.time(), self._keypress_handler)
+        self._cancel_requested = False
+        self._change_keybinds(self.keypress_while_running)
+        if self._loop is not None:
+            self._loop.set_alarm_in(self.__progress_interval,
+                                    self._update_progress)
+
+        def _fetch():
+            if self._cancel_requested:
+                raise Exception('cancelled before execution')
+            return session.get_list(), tuple(session.result_desc()), \
+                session.widths, session.stats
+
+        def _done(result):
+            handler = self._finish_running(session)
+            rows, desc, widths, stats = result
+            if handler is None:
+                if stats is not None:
+                    stats.finish()
+                return
+            rendering = stats is not None and not stats.finished
+            if rendering:
+                stats.start()
+            self._render_result(rows, desc, widths)
+            if rendering:
+                stats.mark('render')
+                stats.finish()
+            self._change_keybinds(on_success or handler)
+
+        def _failed(e):
+            handler = self._finish_running(session)
+            if handler is None:
+                return
+            self._change_keybinds(handler)
+            if self._cancel_requested:
+                self.render_error('Query is cancelled')
+            else:
+                self.render_error(self._error_message(e))
+
+        self._worker.submit(_fetch, callback=_done, errback=_failed)
+
+    def _finish_running(self, session):
+        running, self._running = self._running, None
+        if running is None or session is not self._session:
+            return None # session has been switched while running
+        return running[2]
+
+    def _update_progress(self, loop=None, user_data=None):
+        if self._running is None:
+            return
+        session, started_at, _ = self._running
+        self.update_information('%s running %.1fs rows=%d' %
+                                (session, time.time() - started_at,
+                                 session.rows_received))
+        if self._loop is not None:
+            self._loop.set_alarm_in(self.__progress_interval,
+                                    self._update_progress)
+
+    def cancel_running(self):
+        if self._running is None or self._cancel_requested:
+            return
+        self._cancel_requested = True
+        logger.info('cancel the running query')
+        # the page read and the count, exports run on their own worker
+        self._counted_session = None
+        self._cancel_queries(self._worker, self._counter)
+
+    def _cancel_queries(self, *workers):
+        # never block the UI, the side connection may need a handshake
+        t = threading.Thread(target=self._database.cancel,
+                             args=tuple(x.thread for x in workers))
+        t.daemon = True
+        t.start()
+
+    def _render_result(self, result_list, result_desc, widths=None):
+        max_width = self.__max_width_each_column
+        sizemap = self._update_sizemap(result_desc, {}, max_width)
+        if widths is not None:
+            # measured while the page was converted
+            for i, width in enumerate(widths):
+                sizemap[i] = max(sizemap.get(i, 0), min(width, max_width))
+        else:
+            for values in result_list:
+                self._update_sizemap(values, sizemap, max_width)
+
+        walker = ResultWalker(result_desc, result_list, self._session.offset,
+                              sizemap, column_offset=self._column_offset,
+                              highlights=self._session.highlights)
+        order = self._session.order
+        if self._sort is not None:
+            walker.sort(*self._sort)
+        elif order is not None and order[0] in result_desc:
+            walker.sort(result_desc.index(order[0]), order[1],
+                        rows_sorted=True)
+        self._set_listbox(walker)
+        if self._found_row is not None:
+            idx = self._found_row - self._session.offset
+            self._found_row = None
+            if 0 <= idx < len(result_list):
+                walker.set_focus(walker.position_of(idx))
+            if self._search is not None:
+                text = self._search[0]
+                self._search = (text, walker, walker.search(text))
 
         Events.table_values_rendered.send(self)
+        self._prefetch()
+        if self._counted_session is not self._session:
+            self._count_total(self._session,
+                              exact=self._database.option('exact_count'))
 
-        return True
+    @classmethod
+    def _error_message(cls, e):
+        if len(e.args) >= 2:
+            return '%d: %s' % (e.args[0] or 0, e.args[1])
+        return str(e)
 
     def render_error(self, msg):
         m = urwid.AttrWrap(txt('Ooops! %s' % msg), 'error_message')
         self.footer_columns.replace_me(m)
 
+    def render_notice(self, msg):
+        m = urwid.AttrWrap(txt(msg), 'notice_message')
+        self.footer_columns.replace_me(m)
+
     def render_table_desc(self):
         header_keys = ('name', 'type', 'nullable', 'key', 'default', 'extra')
         header = urwid.Columns(tuple(txt(x) for x in header_keys), dividechars=1)
@@ -200,21 +554,93 @@ class MystiqueView(urwid.Frame):
             self.listbox.body.append(col)
         Events.table_desc_rendered.send(self)
 
+    def open_row_detail(self):
+        walker = self.listbox.body
+        if not isinstance(walker, ResultWalker):
+            return
+        idx = walker.row_index(self.listbox.focus_position)
+        if idx is None:
+            return
+        session = self._session
+        self._worker.submit(lambda:session.get_row(idx),
+                            callback=lambda row:self._on_row_loaded(
+                                session, idx, row),
+                            errback=lambda e:self.render_error(
+                                self._error_message(e)))
+
+    def _on_row_loaded(self, session, idx, row):
+        if session is not self._session:
+            return
+        if row is None:
+            self.render_error('The row is not found, it may be deleted')
+            return
+        from mystique.db import value_optimize
+        width = min(max(len(name) for name, _ in row),
+                    self.__max_width_each_column)
+        self.clear_listbox()
+        for name, value in row:
+            value = value_optimize(value)
+            self.listbox.body.append(urwid.Columns(
+                [('fixed', width, urwid.AttrWrap(txt(name), 'col_head')),
+                 txt(value)], dividechars=2))
+        Events.table_row_rendered.send(
+            self, number=session.offset + idx + 1,
+            size=sum(len(value_optimize(v)) for _, v in row))
+        self._change_keybinds(self.keypress_in_row_detail)
+
     def execute_sql_in_query_editor(self):
         query = self.query_editor.get_query()
         if query:
-            self._session = FreeQuerySession(self._database, query)
-            if self.render_table_values():
-                self._change_keybinds(self.keypress_in_query_result)
+            from mystique.session import FreeQuerySession
+            self._set_session(FreeQuerySession(self._database, query))
+            self.render_table_values(on_success=self.keypress_in_query_result)
             return True
         return False
 
+    def explain_query_in_editor(self, analyze=False):
+        query = self.query_editor.get_query()
+        if not query:
+            return False
+        if analyze and not self._confirm_analyze('ctrl+a', query):
+            return False
+        from mystique.session import ExplainSession
+        self._set_session(ExplainSession(self._database, query,
+                                         analyze=analyze))
+        self.render_table_values(on_success=self.keypress_in_query_result)
+        return True
+
+    def _confirm_analyze(self, key, query):
+        """EXPLAIN ANALYZE runs the query, which may take long or change
+        data, it runs only when the key is pressed twice for the query"""
+        if self._analyze_confirmed == (key, query):
+            self._analyze_confirmed = None
+            return True
+        self._analyze_confirmed = (key, query)
+        self.render_notice('EXPLAIN ANALYZE runs the query, '
+                           '%s again to run it' % key)
+        return False
+
+    def _editor_keypress(self, key):
+        """keys running the query in the editor, True if it is handled"""
+        if key == 'ctrl x':
+            self.execute_sql_in_query_editor()
+        elif key == 'ctrl e':
+            self.explain_query_in_editor()
+        elif key == 'ctrl a':
+            self.explain_query_in_editor(analyze=True)
+        else:
+            return False
+        return True
+
     def open_query_editor(self, query=None, insert_top=False):
         wordlist = with_word_type(self._table_list, AcWordTypes.table)
         if self.session is not None:
             wordlist += with_word_type(self.session.word_list(),
                                          AcWordTypes.column)
-        self.query_editor = QueryEditor(query=query, custom_word_list=wordlist)
+        self.query_editor = QueryEditor(query=query, custom_word_list=wordlist,
+                                        column_loader=self._load_columns,
+                                        debouncer=Debouncer(self.__filter_delay,
+                                                            self._loop))
         if insert_top:
             self.listbox.body.insert(0, self.query_editor)
         else:
@@ -222,6 +648,24 @@ class MystiqueView(urwid.Frame):
         self.focus_to_top()
         Events.query_editor_opened.send(self)
 
+    def _load_columns(self, tables, on_loaded, on_failed):
+        """columns of tables referenced in the editor, desc runs in background
+        unless the schema cache already has them"""
+        known = dict((x.lower(), x) for x in self._table_list)
+        schema = self._database.schema
+        for name in tables:
+            table = known.get(name.lower())
+            if table is None:
+                continue
+            columns = schema.columns(table) if schema is not None else None
+            if columns is not None:
+                on_loaded(name, [x['name'] for x in columns])
+                continue
+            self._worker.submit(
+                lambda t=table:[x['name'] for x in self._database.get_table(t).desc],
+                callback=lambda columns, n=name:on_loaded(n, columns),
+                errback=lambda e, n=name:on_failed(n))
+
     def open_table_filter(self, clear=True):
         if clear:
             self.table_filter.body.clear()
@@ -230,13 +674,146 @@ class MystiqueView(urwid.Frame):
         self.table_filter.body.activate()
         self.focus_to_top()
 
+    def open_prompt(self, caption, on_enter):
+        def _on_enter(text):
+            self.close_prompt()
+            on_enter(text)
+        self.close_prompt()
+        self.prompt = Prompt(caption, _on_enter)
+        self.listbox.body.insert(0, self.prompt)
+        self.focus_to_top()
+
+    def close_prompt(self):
+        if self.prompt_is_shown:
+            del self.listbox.body[0]
+        self.prompt = None
+
+    def open_seek_prompt(self):
+        key = self.session.table.seek_key
+        self.open_prompt('%s >= ' % ','.join(key), self._seek_table_session)
+
+    def _seek_table_session(self, text):
+        key = self.session.table.seek_key
+        values = [x.strip() for x in text.split(',')] if text else []
+        if len(values) != len(key):
+            self.render_error('%d value(s) are required for %s' %
+                              (len(key), ','.join(key)))
+            return
+        self.session.seek(values)
+        self.render_table_values()
+
+    def open_search_prompt(self):
+        self.open_prompt('search: ', self._search_rows)
+
+    def _search_rows(self, text):
+        walker = self.listbox.body
+        if not text or not isinstance(walker, ResultWalker):
+            return
+        self._search = (text, walker, walker.search(text))
+        self._next_match(current=True)
+
+    def _next_match(self, backward=False, current=False):
+        if self._search is None:
+            return
+        text, walker, matches = self._search
+        if walker is not self.listbox.body:
+            # another page is shown, search it
+            walker = self.listbox.body
+            if not isinstance(walker, ResultWalker):
+                return
+            matches = walker.search(text)
+            self._search = (text, walker, matches)
+            current = True
+        pos = self.listbox.focus_position
+        if backward:
+            found = [i for i, x in enumerate(matches)
+                     if walker.position_of(x) < pos]
+        else:
+            found = [i for i, x in enumerate(matches)
+                     if walker.position_of(x) > pos or
+                     (current and walker.position_of(x) == pos)]
+        if not found and self._session.searchable and self._sort is None:
+            # rows in the order of the session, look at the other pages
+            self._find_in_session(text, walker, backward)
+            return
+        if not matches:
+            self.render_error('"%s" is not found on this page' % text)
+            return
+        if backward:
+            i = found[-1] if found else len(matches) - 1
+        else:
+            i = found[0] if found else 0
+        walker.set_focus(walker.position_of(matches[i]))
+        self.render_notice('"%s" %d/%d' % (text, i + 1, len(matches)))
+
+    def _find_in_session(self, text, walker, backward):
+        session = self._session
+        start = session.offset + (0 if backward else len(walker.rows) - 1)
+        self._worker.submit(lambda:session.find(text, start, backward),
+                            callback=lambda n:self._on_found(session, text, n),
+                            errback=lambda e:self.render_error(
+                                self._error_message(e)))
+
+    def _on_found(self, session, text, row):
+        if session is not self._session or self._running is not None:
+            return
+        if row is None:
+            self.render_error('"%s" is not found' % text)
+            return
+        walker = self.listbox.body
+        idx = row - session.offset
+        if isinstance(walker, ResultWalker) and 0 <= idx < len(walker.rows):
+            walker.set_focus(walker.position_of(idx))
+            self.render_notice('"%s" row %d' % (text, row + 1))
+            return
+        session.jump(row // session.limit + 1)
+        self._found_row = row
+        self.render_table_values()
+
+    def _sort_by_column(self):
+        """the leftmost column shown is sorted asc, desc, then not sorted"""
+        walker = self.listbox.body
+        if not isinstance(walker, ResultWalker):
+            return
+        column = walker.column_offset
+        current = walker.sort_order
+        if current is None or current[0] != column:
+            sort = (column, False)
+        elif not current[1]:
+            sort = (column, True)
+        else:
+            sort = None
+        session = self._session
+        name = tuple(session.result_desc())[column]
+        if session.order is not None or session.sortable(name):
+            # sorted over all pages, by the server for indexed columns or
+            # in the spill file
+            whole = sort is not None and session.sortable(name)
+            session.sort(name if whole else None,
+                         sort[1] if whole else False)
+            self._sort = None if whole else sort
+            self.render_table_values()
+            return
+        self._sort = sort
+        walker.sort(*(sort or (None,)))
+
     def close_table_filter(self):
         self.table_filter.body.reset()
         self.table_filter.body.deactivate()
         self.render_table_list()
 
     def _do_table_filter(self, results):
-        self.render_table_list()
+        if self._keypress_handler != self.keypress_default:
+            return
+        if not self.table_filter_is_shown:
+            self.render_table_list()
+            return
+        self._table_walker.set_tables(results)
+        Events.table_list_rendered.send(self)
+
+    def keypress_while_loading(self, size, key):
+        if key in ('q', 'Q'):
+            raise urwid.ExitMainLoop()
 
     def keypress_default(self, size, key):
         if self.table_filter_is_shown:
@@ -258,12 +835,17 @@ class MystiqueView(urwid.Frame):
                                        exit_on_q=True)
 
     def keypress_in_table_session(self, size, key):
+        if self.prompt_is_shown:
+            if key == 'esc':
+                self.close_prompt()
+                return
+            return super(MystiqueView, self).keypress(size, key)
         if self.query_editor_is_shown:
             if key == 'esc':
                 del self.listbox.body[0]
                 Events.table_values_rendered.send(self)
-            elif key == 'ctrl x':
-                self.execute_sql_in_query_editor()
+            elif self._editor_keypress(key):
+                return
             return self._common_keypresses(size, key, scrollable=True)
         if key in ('q', 'Q'):
             self.render_table_list()
@@ -271,6 +853,34 @@ class MystiqueView(urwid.Frame):
         elif key == 'd':
             self.render_table_desc()
             self._change_keybinds(self.keypress_in_table_desc)
+        elif key == 'enter':
+            self.open_row_detail()
+            return
+        elif key == '/':
+            self.open_search_prompt()
+            return
+        elif key in ('n', 'N'):
+            self._next_match(backward=key == 'N')
+            return
+        elif key == 'o':
+            self._sort_by_column()
+            return
+        elif key == 'i':
+            self.render_stats()
+            return
+        elif key == 's' and self.session.keyset:
+            self.open_seek_prompt()
+            return
+        elif key == 'p':
+            self.open_page_prompt()
+            return
+        elif key == 'c':
+            self._count_total(self._session, exact=True)
+        elif key == 'e':
+            self.open_export_prompt()
+            return
+        elif key == 'r':
+            self._refresh_session()
         elif key == 'x':
             self.open_query_editor(query=self.session.default_query(),
                                    insert_top=True)
@@ -280,13 +890,23 @@ class MystiqueView(urwid.Frame):
 
     def keypress_in_table_desc(self, size, key):
         if key in ('q', 'Q'):
-            if self.render_table_values():
-                self._change_keybinds(self.keypress_in_table_session)
+            self.render_table_values(on_success=self.keypress_in_table_session)
+        return self._common_keypresses(size, key, focus_on_g=True)
+
+    def keypress_in_row_detail(self, size, key):
+        if key in ('q', 'Q'):
+            self.render_table_values(on_success=self.keypress_in_table_session)
         return self._common_keypresses(size, key, focus_on_g=True)
 
+    def keypress_while_running(self, size, key):
+        if key in ('esc', 'ctrl c'):
+            self.cancel_running()
+        elif key in ('up', 'down', 'page up', 'page down'):
+            return super(MystiqueView, self).keypress(size, key)
+
     def keypress_in_editor(self, size, key):
-        if key == 'ctrl x':
-            self.execute_sql_in_query_editor()
+        if self._editor_keypress(key):
+            return
         elif key == 'esc':
             self.query_editor = None
             self.render_table_list()
@@ -295,18 +915,44 @@ class MystiqueView(urwid.Frame):
             return super(MystiqueView, self).keypress(size, key)
 
     def keypress_in_query_result(self, size, key):
+        if self.prompt_is_shown:
+            if key == 'esc':
+                self.close_prompt()
+                return
+            return super(MystiqueView, self).keypress(size, key)
         if self.query_editor_is_shown:
             if key == 'esc':
                 del self.listbox.body[0]
                 return
-            elif key == 'ctrl x':
-                self.execute_sql_in_query_editor()
-                Events.table_values_rendered.send(self)
+            elif self._editor_keypress(key):
+                return
             return self._common_keypresses(size, key, scrollable=True)
         if key == 'x':
             self.open_query_editor(query=self.session.default_query(),
                                    insert_top=True)
             return
+        elif key == 'p':
+            self.open_page_prompt()
+            return
+        elif key == 'c':
+            self._count_total(self._session, exact=True)
+        elif key == 'e':
+            self.open_export_prompt()
+            return
+        elif key == 'r':
+            self._refresh_session()
+        elif key == '/':
+            self.open_search_prompt()
+            return
+        elif key in ('n', 'N'):
+            self._next_match(backward=key == 'N')
+            return
+        elif key == 'o':
+            self._sort_by_column()
+            return
+        elif key == 'i':
+            self.render_stats()
+            return
         elif key == 'q':
             self.render_table_list()
         return self._common_keypresses(size, key, scrollable=True,
@@ -330,6 +976,13 @@ class MystiqueView(urwid.Frame):
                 self.render_table_values()
         if scrollable:
             if key in ('right', 'left'):
+                walker = self.listbox.body
+                if isinstance(walker, ResultWalker):
+                    # one shared offset, rows are rebuilt when displayed
+                    walker.scroll_columns(1 if key == 'right' else -1)
+                    self._column_offset = walker.column_offset
+                    return
+
                 ret = super(MystiqueView, self).keypress(size, key)
 
                 focus_pos = self.listbox.focus_position
@@ -352,6 +1005,13 @@ class MystiqueView(urwid.Frame):
     def keypress(self, size, key):
         return self._keypress_handler(size, key)
 
+    def render(self, size, focus=False):
+        if isinstance(self.listbox.body, ResultWalker):
+            self.listbox.body.set_width(size[0])
+        canvas = super(MystiqueView, self).render(size, focus)
+        startup.mark('first paint')
+        return canvas
+
     def focus_to_top(self):
         self.listbox.body.set_focus(0)
 
@@ -361,7 +1021,14 @@ class MystiqueView(urwid.Frame):
             self.listbox.body.set_focus(pos)
 
     def clear_listbox(self, body=[]):
-        self.listbox.body[:] = urwid.SimpleListWalker(body)
+        if isinstance(self.listbox.body, urwid.SimpleListWalker):
+            self.listbox.body[:] = urwid.SimpleListWalker(body)
+        else:
+            self._set_listbox(urwid.SimpleListWalker(list(body)))
+
+    def _set_listbox(self, walker):
+        self.listbox = urwid.ListBox(walker)
+        self.body = self.listbox
 
     def update_information(self, v):
         self.information_text2.set_text(v or '')
@@ -400,6 +1067,11 @@ class MystiqueView(urwid.Frame):
     def query_editor_is_shown(self):
         return self.listbox.body[0] == self.query_editor
 
+    @property
+    def prompt_is_shown(self):
+        return self.prompt is not None and self.listbox.body and \
+            self.listbox.body[0] == self.prompt
+
     @property
     def table_filter_is_shown(self):
         return self.listbox.body and \
@@ -414,6 +1086,12 @@ def info_of_table_desc(view):
     view.update_information('desc %s' % view.session.name())
 
 
+def info_of_table_row(view, number, size):
+    view.update_information('%s row %d (%sB)' % (view.session.table.name,
+                                                 number,
+                                                 util.human_readable(size)))
+
+
 def info_of_table_list(view):
     view.update_information('%s.Tables' % view.db_name)
 
@@ -427,24 +1105,32 @@ def keybind_information_in_footer(*args, **kwargs):
     view.update_keybind_information(keybinds[name])
 
 
-def main():
-    logger.debug('Bootup mystique...')
-
-    import argparse
-    parser = argparse.ArgumentParser(description='%s v%s' % (mystique.__mystique__, mystique.__version__))
-    parser.add_argument('-d', '--db', type=str, help='the database name')
-    parser.add_argument('-c', '--config', type=str, help='a path to config file')
-    parser.add_argument('-n', '--name', type=str, help='the name of connection alias')
-    opts = parser.parse_args()
-    logger.debug('Options=%s' % str(opts))
-
+def run(opts):
     Events.query_editor_opened.connect(info_of_query_editor)
     Events.table_list_rendered.connect(info_of_table_list)
     Events.table_values_rendered.connect(info_of_session)
     Events.table_desc_rendered.connect(info_of_table_desc)
+    Events.table_row_rendered.connect(info_of_table_row)
     Events.keybind_changed.connect(keybind_information_in_footer)
-    view = MystiqueView(config.load_config(opts))
-    urwid.MainLoop(view, palette).run()
+    conf = config.load_config(opts)
+    startup.mark('config')
+    view = MystiqueView(conf)
+    try:
+        loop = urwid.MainLoop(view, palette)
+        loop.screen.tty_signal_keys(intr='undefined') # ctrl+c cancels queries
+        view.attach(loop)
+        view.load()
+        loop.run()
+    finally:
+        view.close()
+        logger.info('[STARTUP] %s' % startup.report())
+        if env.MYSTIQUE_ENV_STARTUP_TRACE:
+            sys.stderr.write('startup: %s\n' % startup.report())
+
+
+def main():
+    from mystique.cli import main as cli_main
+    return cli_main()
 
 
 if __name__ == '__main__':
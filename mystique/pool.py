@@ -0,0 +1,154 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+
+import time
+import threading
+import MySQLdb
+from contextlib import contextmanager
+from mystique.log import logger
+
+
+# CR_SERVER_GONE_ERROR, CR_SERVER_LOST
+GONE_AWAY_ERRORS = (2006, 2013)
+
+ER_QUERY_INTERRUPTED = 1317
+
+
+def is_gone_away(e):
+    return isinstance(e, MySQLdb.OperationalError) and \
+        len(e.args) > 0 and e.args[0] in GONE_AWAY_ERRORS
+
+
+def is_interrupted(e):
+    return isinstance(e, MySQLdb.OperationalError) and \
+        len(e.args) > 0 and e.args[0] == ER_QUERY_INTERRUPTED
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception as e:
+        logger.debug('[POOL] failed to close connection: %s' % e)
+
+
+class ConnectionPool(object):
+
+    def __init__(self, config, size=4, idle_timeout=300, ping_interval=30):
+        self._config = config
+        self._size = max(size, 1)
+        self._idle_timeout = idle_timeout
+        self._ping_interval = ping_interval
+        self._idle = [] # [(connection, last used), ...]
+        self._in_use = 0
+        self._busy = {} # connection => thread which acquired it
+        self._cond = threading.Condition()
+        self.stats = dict(hits=0, creates=0, waits=0, pings=0, discards=0)
+
+    @property
+    def size(self):
+        return self._size
+
+    def _count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+
+    def _connect(self):
+        conn = MySQLdb.connect(**self._config)
+        self._count('creates')
+        logger.debug('[POOL] new connection: thread_id=%d' % conn.thread_id())
+        return conn
+
+    def _revive(self, entry):
+        if entry is None:
+            return self._connect()
+        conn, last_used = entry
+        idle = time.time() - last_used
+        if idle > self._idle_timeout:
+            logger.debug('[POOL] idle timeout (%.1fs)' % idle)
+            _close_quietly(conn)
+            return self._connect()
+        if idle > self._ping_interval:
+            self._count('pings')
+            try:
+                conn.ping()
+            except MySQLdb.Error as e:
+                logger.info('[POOL] dead connection is dropped: %s' % e)
+                _close_quietly(conn)
+                return self._connect()
+        self._count('hits')
+        return conn
+
+    def acquire(self):
+        with self._cond:
+            while not self._idle and self._in_use >= self._size:
+                self.stats['waits'] += 1
+                self._cond.wait()
+            self._in_use += 1
+            entry = self._idle.pop() if self._idle else None
+        try:
+            conn = self._revive(entry)
+        except:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._busy[conn] = threading.current_thread()
+        return conn
+
+    def release(self, conn):
+        try:
+            # do not leak an open transaction (or its snapshot) to the next user
+            conn.rollback()
+        except MySQLdb.Error as e:
+            logger.info('[POOL] rollback failed, discard connection: %s' % e)
+            self.discard(conn)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._busy.pop(conn, None)
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+
+    def discard(self, conn):
+        _close_quietly(conn)
+        with self._cond:
+            self._in_use -= 1
+            self._busy.pop(conn, None)
+            self.stats['discards'] += 1
+            self._cond.notify()
+
+    def busy_thread_ids(self, *owners):
+        """of connections in use, only of those the `owners` threads
+        acquired if any is given"""
+        with self._cond:
+            busy = [conn for conn, thread in self._busy.items()
+                    if not owners or thread in owners]
+        return [x.thread_id() for x in busy]
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except Exception as e:
+            if is_gone_away(e):
+                logger.info('[POOL] server has gone away: %s' % e)
+                self.discard(conn)
+            else:
+                self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            _close_quietly(conn)
+        logger.info('[POOL] closed: %s' % self.stats_string)
+
+    @property
+    def stats_string(self):
+        return 'hits=%(hits)d creates=%(creates)d waits=%(waits)d ' \
+            'pings=%(pings)d discards=%(discards)d' % self.stats
@@ -0,0 +1,113 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import re
+import time
+import threading
+from collections import OrderedDict
+from mystique.log import logger
+
+
+_CACHEABLE = re.compile(r'^\s*\(*\s*(?:select|show|desc|describe|explain|with)\b',
+                        re.I)
+_NOT_CACHEABLE = re.compile(
+    r'\b(?:for\s+update|lock\s+in\s+share\s+mode|into)\b', re.I)
+
+
+def normalize_query(query):
+    """whitespace is collapsed and comments are dropped outside of quotes,
+    a trailing `;` is removed. None if the result may not be cached."""
+    out = []
+    quote = None
+    space = False
+    i, n = 0, len(query)
+    while i < n:
+        c = query[i]
+        if quote:
+            out.append(c)
+            if c == '\\' and quote != '`' and i + 1 < n:
+                out.append(query[i + 1])
+                i += 1
+            elif c == quote:
+                quote = None
+        elif c in ('"', "'", '`'):
+            if space and out:
+                out.append(' ')
+            space = False
+            quote = c
+            out.append(c)
+        elif c == '#' or query.startswith('-- ', i):
+            end = query.find('\n', i)
+            i = n if end < 0 else end
+            space = True
+            continue
+        elif query.startswith('/*', i):
+            end = query.find('*/', i + 2)
+            i = n if end < 0 else end + 2
+            space = True
+            continue
+        elif c.isspace():
+            space = True
+        else:
+            if space and out:
+                out.append(' ')
+            space = False
+            out.append(c)
+        i += 1
+    query = ''.join(out).rstrip(';').rstrip()
+    if not _CACHEABLE.match(query) or _NOT_CACHEABLE.search(query):
+        return None
+    return query
+
+
+class ResultCache(object):
+    """Pages of results shared by sessions of one connection, evicted when
+    they are older than `ttl` secs or by LRU over `max_bytes`"""
+
+    def __init__(self, max_bytes, ttl):
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._entries = OrderedDict() # key => (value, size, stored at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(value, stored at) or None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if time.time() - entry[2] > self._ttl:
+                self._bytes -= entry[1]
+                return None
+            self._entries[key] = entry
+            return entry[0], entry[2]
+
+    def put(self, key, value, size):
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size, time.time())
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[1]
+
+    def forget(self, base):
+        """drops every page of a result, keys are (base, page...)"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == base]:
+                self._bytes -= self._entries.pop(key)[1]
+        logger.info('[CACHE] forgot %s' % (base,))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self._entries), bytes=self._bytes)
@@ -0,0 +1,181 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import os
+import re
+import json
+import time
+import threading
+from mystique.log import logger
+
+
+_TABLES_QUERY = '''select TABLE_NAME, CREATE_TIME, UPDATE_TIME, TABLE_ROWS,
+DATA_LENGTH, INDEX_LENGTH from information_schema.TABLES
+where TABLE_SCHEMA = %s'''
+
+_COLUMNS_QUERY = '''select TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE,
+COLUMN_KEY, COLUMN_DEFAULT, EXTRA from information_schema.COLUMNS
+where TABLE_SCHEMA = %s order by TABLE_NAME, ORDINAL_POSITION'''
+
+
+def _str_or_none(v):
+    return str(v) if v is not None else None
+
+
+class SchemaCache(object):
+    """Tables and columns of one database, persisted per connection alias.
+
+    Within `ttl` seconds the cache is trusted as is. After that one query
+    on information_schema.TABLES finds created, dropped and altered tables
+    (by CREATE_TIME/UPDATE_TIME) and only their columns are forgotten.
+    """
+
+    version = 1
+
+    save_delay = 5 # secs, columns put one by one are saved together
+
+    def __init__(self, database, key, cache_dir=None, ttl=600):
+        self._database = database
+        self._db = database.config('db')
+        self._ttl = ttl
+        self._path = os.path.join(os.path.expanduser(cache_dir),
+                                  '%s.json' % re.sub(r'[^\w.@-]', '_', key)) \
+            if cache_dir else None
+        self._lock = threading.RLock()
+        self._data = self._load()
+        self._dirty = False # columns are put since the last save
+        self._timer = None
+
+    def _load(self):
+        if self._path and os.path.exists(self._path):
+            try:
+                with open(self._path) as f:
+                    data = json.load(f)
+                if data.get('version') == self.version:
+                    logger.info('[SCHEMA] loaded: %s' % self._path)
+                    return data
+            except (IOError, ValueError) as e:
+                logger.info('[SCHEMA] broken cache %s: %s' % (self._path, e))
+        return dict(version=self.version, dbs={})
+
+    def save(self):
+        if not self._path:
+            return
+        with self._lock:
+            body = json.dumps(self._data)
+            self._dirty = False
+        try:
+            d = os.path.dirname(self._path)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            tmp = '%s.%d.tmp' % (self._path, os.getpid())
+            with open(tmp, 'w') as f:
+                f.write(body)
+            os.rename(tmp, self._path)
+        except (IOError, OSError) as e:
+            logger.info('[SCHEMA] can not save %s: %s' % (self._path, e))
+
+    @property
+    def _schema(self):
+        return self._data['dbs'].setdefault(
+            self._db, dict(checked_at=0, tables={}))
+
+    def tables(self):
+        with self._lock:
+            if time.time() - self._schema['checked_at'] > self._ttl:
+                self.refresh()
+            return sorted(self._schema['tables'].keys())
+
+    def table_info(self, name):
+        with self._lock:
+            return self._schema['tables'].get(name)
+
+    def columns(self, name):
+        with self._lock:
+            info = self._schema['tables'].get(name)
+            return info and info.get('columns')
+
+    def table_status(self):
+        """{table name: (estimated rows, data + index length)}"""
+        self.tables() # refreshes after ttl
+        with self._lock:
+            return dict((k, (v.get('rows'), (v.get('data_length') or 0) +
+                             (v.get('index_length') or 0)))
+                        for k, v in self._schema['tables'].items())
+
+    def put_columns(self, name, columns):
+        with self._lock:
+            info = self._schema['tables'].setdefault(name, {})
+            info['columns'] = columns
+            self._dirty = True
+            if self._path and self._timer is None:
+                self._timer = threading.Timer(self.save_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """saves columns put since the last save, if any"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+            dirty = self._dirty
+        if timer is not None:
+            timer.cancel()
+        if dirty:
+            self.save()
+
+    def close(self):
+        self.flush()
+
+    def refresh(self):
+        with self._database.new_cursor() as cursor:
+            cursor.execute(_TABLES_QUERY, (self._db,))
+            rows = cursor.fetchall()
+        with self._lock:
+            old = self._schema['tables']
+            tables = {}
+            for name, created, updated, nrows, data_len, index_len in rows:
+                info = dict(create_time=_str_or_none(created),
+                            update_time=_str_or_none(updated),
+                            rows=nrows, data_length=data_len,
+                            index_length=index_len)
+                prev = old.get(name)
+                if prev and prev.get('columns') is not None and \
+                    prev.get('create_time') == info['create_time'] and \
+                    prev.get('update_time') == info['update_time']:
+                        info['columns'] = prev['columns']
+                tables[name] = info
+            self._schema['tables'] = tables
+            self._schema['checked_at'] = time.time()
+        logger.info('[SCHEMA] %d tables in %s' % (len(tables), self._db))
+        self.save()
+
+    def warm(self):
+        """fetches columns of every table in one query"""
+        with self._lock:
+            missing = [k for k, v in self._schema['tables'].items()
+                       if v.get('columns') is None]
+        if not missing:
+            return 0
+        columns = {}
+        with self._database.new_cursor() as cursor:
+            cursor.execute(_COLUMNS_QUERY, (self._db,))
+            for c in iter(cursor):
+                columns.setdefault(c[0], []).append(dict(
+                    name = c[1],
+                    type = c[2],
+                    nullable = c[3],
+                    key = c[4],
+                    default = c[5] or 'NULL',
+                    extra = c[6]
+                ))
+        with self._lock:
+            for name, info in self._schema['tables'].items():
+                if info.get('columns') is None and name in columns:
+                    info['columns'] = columns[name]
+        logger.info('[SCHEMA] columns of %d tables are warmed' % len(columns))
+        self.save()
+        return len(missing)
+
+    def invalidate(self):
+        with self._lock:
+            self._data['dbs'].pop(self._db, None)
+        self.save()
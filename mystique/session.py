@@ -1,16 +1,139 @@
 # -*- encoding:utf8 -*-
 from __future__ import absolute_import
 from mystique.log import logger
-from mystique.db import value_optimize
+from mystique.db import quote_identifier
+from mystique.pool import is_gone_away
+from mystique.convert import RowConverter
+from mystique.resultcache import normalize_query
+from mystique.spill import SpillStore
+from mystique.stats import QueryStats
+from mystique import explain
+from collections import OrderedDict
+from functools import wraps
+import threading
+import time
 import os
 
 
+def _synchronized(func):
+    @wraps(func)
+    def _wrapped(self, *args, **kwargs):
+        with self._lock:
+            return func(self, *args, **kwargs)
+    return _wrapped
+
+
+class _Page(object):
+
+    __slots__ = ('rows', 'has_next', 'keys', 'reached_top', 'widths', 'size',
+                 'cached_at', 'stats')
+
+    __row_overhead = 64
+
+    def __init__(self, rows, has_next, keys=(), reached_top=False,
+                 widths=None, nbytes=None):
+        self.rows = rows
+        self.has_next = has_next
+        self.keys = keys
+        self.reached_top = reached_top
+        self.widths = widths # widest value per column, if it is known
+        if nbytes is None:
+            nbytes = sum(len(v) for values in rows for v in values)
+        self.size = nbytes + len(rows) * self.__row_overhead
+        self.cached_at = None
+        self.stats = None # QueryStats of reading the page
+
+    def cached(self, at):
+        """the same page marked as taken from the result cache"""
+        page = _Page(self.rows, self.has_next, self.keys, self.reached_top,
+                     self.widths, nbytes=0)
+        page.size = self.size
+        page.cached_at = at
+        return page
+
+    @classmethod
+    def of(cls, rows, limit, **kwargs):
+        """a page of the first `limit` of converted rows (convert.Rows)"""
+        return cls(rows[:limit], len(rows) > limit, widths=rows.widths,
+                   nbytes=rows.nbytes, **kwargs)
+
+
+class _PageCache(object):
+
+    def __init__(self, max_pages, max_bytes):
+        self._max_pages = max(max_pages, 1)
+        self._max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+
+    @property
+    def max_pages(self):
+        return self._max_pages
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def get(self, token):
+        page = self._pages.pop(token, None)
+        if page is not None:
+            self._pages[token] = page
+        return page
+
+    def put(self, token, page):
+        self._forget(token)
+        self._pages[token] = page
+        self._bytes += page.size
+        # the latest page always stays, even when it is over the budget
+        while len(self._pages) > 1 and (len(self._pages) > self._max_pages
+                                        or self._bytes > self._max_bytes):
+            self._forget(next(iter(self._pages)))
+
+    def _forget(self, token):
+        page = self._pages.pop(token, None)
+        if page is not None:
+            self._bytes -= page.size
+            _finish_stats(page)
+
+    def clear(self):
+        for page in self._pages.values():
+            _finish_stats(page)
+        self._pages.clear()
+        self._bytes = 0
+
+
+def _finish_stats(page):
+    # prefetched pages are finished when rendered, or here if never
+    if page.stats is not None:
+        page.stats.finish()
+
+
+def _age_string(secs):
+    for unit, size in (('h', 3600), ('m', 60)):
+        if secs >= size:
+            return '%d%s' % (secs // size, unit)
+    return '%ds' % secs
+
+
 class _Session(object):
 
-    def __init__(self):
+    def __init__(self, options, results=None):
         self.offset = 0
-        self.limit = 100
+        self.limit = options('page_size')
+        self.widths = None
+        self.cached_at = None # when the current page was cached, if it was
+        self.stats = None # QueryStats of the current page
+        self.highlights = () # indexes of rows in the current page to stand out
+        self._server_stats = options('server_stats')
+        self._results = results # ResultCache shared with other sessions
+        self._current_result_desc = None
         self._has_next = False
+        self._lock = threading.RLock()
+        self._closed = False
+        self._pages = _PageCache(options('page_cache_size'),
+                                 options('prefetch_memory'))
+        self.total = None
+        self.total_exact = False
 
     def next_page(self):
         self.offset += self.limit
@@ -18,6 +141,9 @@ class _Session(object):
     def prev_page(self):
         self.offset -= self.limit
 
+    def jump(self, page):
+        self.offset = (page - 1) * self.limit
+
     def has_prev(self):
         return self.offset > 0
 
@@ -29,14 +155,169 @@ class _Session(object):
     def has_next(self):
         return self._has_next
 
+    @property
+    def rows_received(self):
+        return 0
+
+    @_synchronized
     def get_list(self):
-        return []
+        page = self._page(self._page_token())
+        self._apply_page(page)
+        return list(page.rows)
+
+    @_synchronized
+    def prefetch(self, depth):
+        """reads up to `depth` pages ahead into the cache, returns pages read"""
+        fetched = 0
+        token = self._page_token()
+        page = self._pages.get(token)
+        # keep the current and the previous page in the cache
+        depth = min(depth, self._pages.max_pages - 2)
+        used = page.size if page is not None else 0
+        for _ in range(depth):
+            if self._closed or page is None or not page.has_next or \
+                used >= self._pages.max_bytes:
+                    break
+            token = self._next_token(token, page)
+            next_page = self._pages.get(token)
+            if next_page is None:
+                next_page = self._load_page(token)
+                self._pages.put(token, next_page)
+                fetched += 1
+            used += next_page.size
+            page = next_page
+        return fetched
+
+    def _page(self, token):
+        page = self._pages.get(token)
+        if page is None:
+            page = self._load_page(token)
+            self._pages.put(token, page)
+        return page
+
+    def _load_page(self, token):
+        """reads a page with its stats, which are finished by the caller"""
+        stats = QueryStats(self.default_query(),
+                           server_status=self._server_stats)
+        try:
+            page = self._cached_or_read_page(token, stats)
+        except Exception as e:
+            stats.error = str(e)
+            stats.finish()
+            raise
+        stats.page_rows = len(page.rows)
+        stats.page_bytes = page.size
+        page.stats = stats
+        return page
+
+    def _cached_or_read_page(self, token, stats):
+        base = self._result_base() if self._results is not None else None
+        if base is None:
+            return self._read_page(token, stats)
+        key = (base, token, self.limit)
+        hit = self._results.get(key)
+        if hit is not None:
+            (page, desc), stored_at = hit
+            if desc is not None:
+                self._current_result_desc = desc
+            stats.source = 'cache'
+            return page.cached(stored_at)
+        page = self._read_page(token, stats)
+        self._results.put(key, (page, self._current_result_desc), page.size)
+        return page
+
+    def _result_base(self):
+        """key of the result in the shared cache, None to never cache it"""
+        return None
+
+    def _page_token(self):
+        return self.offset
+
+    def _next_token(self, token, page):
+        return token + self.limit
+
+    def _read_page(self, token, stats):
+        return _Page([], False)
+
+    def _apply_page(self, page):
+        self._has_next = page.has_next
+        self.widths = page.widths
+        self.cached_at = page.cached_at
+        self.stats = page.stats
+
+    @property
+    def order(self):
+        """(column, descending) the server sorts rows by, None if not sorted"""
+        return None
+
+    def sortable(self, column):
+        """rows of every page can be sorted by the column with `sort`"""
+        return False
+
+    @property
+    def searchable(self):
+        """rows of other pages can be looked for with `find`"""
+        return False
+
+    def find(self, text, start, backward=False):
+        return None
+
+    def estimate_total(self):
+        return None
+
+    @property
+    def count_query(self):
+        return None
+
+    @property
+    def export_query(self):
+        return None
+
+    def set_total(self, count, exact=False):
+        if count is not None and (exact or not self.total_exact):
+            self.total = count
+            self.total_exact = exact
+
+    @property
+    def page_number(self):
+        return self.offset // self.limit + 1
+
+    @property
+    def page_count(self):
+        if self.total is None:
+            return None
+        return max((self.total + self.limit - 1) // self.limit, 1)
+
+    def _total_string(self):
+        if self.total is None:
+            return ''
+        return ' of %s%d (%d/%s%d)' % ('' if self.total_exact else '~',
+                                       self.total, self.page_number,
+                                       '' if self.total_exact else '~',
+                                       self.page_count)
+
+    def _cached_string(self):
+        if self.cached_at is None:
+            return ''
+        return ' cached (%s)' % _age_string(time.time() - self.cached_at)
 
     def result_desc(self):
         return []
 
+    @_synchronized
+    def refresh(self):
+        """the next pages are read from the server, not from any cache"""
+        self._pages.clear()
+        self.total = None
+        self.total_exact = False
+        base = self._result_base() if self._results is not None else None
+        if base is not None:
+            self._results.forget(base)
+
+    @_synchronized
     def close(self):
-        pass
+        self._closed = True
+        self._pages.clear()
 
     def name(self):
         return self.__str__()
@@ -55,24 +336,160 @@ class TableSession(_Session):
 
     def __init__(self, table):
         self.table = table
-        super(TableSession, self).__init__()
+        super(TableSession, self).__init__(table.option,
+                                           results=table.result_cache)
         self._result_size = 0
+        self._seek = None # (operator, key values) of the current page
+        self._keys = []
+        self._at_start = True
+        self._anchor = None
+        self._history = [] # pages to go back to, [(seek, offset), ...]
+        self._order = None
 
-    def word_list(self):
-        return tuple(self.result_desc())
+    @property
+    def keyset(self):
+        # sorted by another column, pages are read by offset
+        return bool(self.table.seek_key) and self._order is None
 
-    def get_list(self):
-        ret = self.table.simple_list(offset=self.offset, limit=self.limit+1)
-        self._result_size = len(ret)
-        self._has_next = self._result_size > self.limit
-        if self._has_next:
-            del ret[self._result_size - 1]
-            self._result_size -= 1
-        return ret
+    @property
+    def order(self):
+        return self._order
+
+    @_synchronized
+    def sort(self, column, descending=False):
+        """sorts on the server by an indexed column, None for the key order"""
+        self._order = (column, descending) if column is not None else None
+        self.offset = 0
+        self._seek = None
+        self._anchor = None
+        self._at_start = True
+        self._history = []
+        self._pages.clear()
+
+    def next_page(self):
+        if not self.keyset:
+            return super(TableSession, self).next_page()
+        self._history.append((self._seek, self.offset))
+        self.offset += self._result_size
+        self._seek = ('>', self._keys[-1])
+        self._at_start = False
+
+    def prev_page(self):
+        if not self.keyset:
+            return super(TableSession, self).prev_page()
+        if self._history:
+            self._seek, self.offset = self._history.pop()
+            self._at_start = self._seek is None
+        elif not self._keys and self._seek is not None and \
+            self._seek[0] == '@':
+                # jumped past the last row, no key to read before
+                self.offset = max(self.offset - self.limit, 0)
+                self._seek = ('@', self.offset) if self.offset else None
+                self._at_start = not self.offset
+        else:
+            # offset is not known from a seek anchor, count from there
+            self.offset = max(self.offset - self.limit, 0)
+            self._seek = ('<', self._keys[0] if self._keys else self._seek[1])
+
+    def has_prev(self):
+        if not self.keyset:
+            return super(TableSession, self).has_prev()
+        return not self._at_start
+
+    def jump(self, page):
+        if not self.keyset:
+            return super(TableSession, self).jump(page)
+        self.offset = (page - 1) * self.limit
+        self._seek = ('@', self.offset) if self.offset else None
+        self._anchor = None
+        self._at_start = not self.offset
+        self._history = []
+
+    def seek(self, values):
+        self.offset = 0
+        self._seek = ('>=', tuple(values))
+        self._anchor = tuple(values)
+        self._at_start = False
+        self._history = []
+
+    def _page_token(self):
+        return self._seek if self.keyset else self.offset
+
+    def _next_token(self, token, page):
+        if not self.keyset:
+            return token + self.limit
+        return ('>', page.keys[-1])
+
+    def _read_page(self, token, stats):
+        if not self.keyset:
+            ret = self.table.simple_list(offset=token, limit=self.limit+1,
+                                         order_by=self._order, stats=stats)
+            return _Page.of(ret, self.limit)
+        op, key = token or (None, None)
+        if op == '@':
+            ret, keys = self.table.seek_list(limit=self.limit+1, offset=key,
+                                             stats=stats)
+            return _Page.of(ret, self.limit, keys=keys[:self.limit])
+        if op == '<':
+            ret, keys = self.table.seek_list(limit=self.limit+1, before=key,
+                                             stats=stats)
+            if len(ret) > self.limit:
+                # the page we came from follows
+                return _Page(ret[1:], True, keys[1:], widths=ret.widths,
+                             nbytes=ret.nbytes)
+            # reached the top of the table, show the first page instead
+            page = self._read_page(None, stats)
+            return _Page(page.rows, page.has_next, page.keys, reached_top=True,
+                         widths=page.widths)
+        ret, keys = self.table.seek_list(
+            limit=self.limit+1,
+            after=key if op == '>' else None,
+            since=key if op == '>=' else None,
+            stats=stats)
+        return _Page.of(ret, self.limit, keys=keys[:self.limit])
+
+    def _apply_page(self, page):
+        super(TableSession, self)._apply_page(page)
+        if page.reached_top:
+            self.offset = 0
+            self._seek = None
+            self._anchor = None
+            self._at_start = True
+            self._history = []
+            self._pages.put(None, _Page(page.rows, page.has_next, page.keys,
+                                        widths=page.widths))
+        self._keys = list(page.keys)
+        self._result_size = len(page.rows)
 
     def word_list(self):
         return tuple(self.result_desc())
 
+    def sortable(self, column):
+        return self.table.indexed(column)
+
+    def _result_base(self):
+        return ('table', self.table.config('db'), self.table.name, self._order)
+
+    def get_row(self, idx):
+        """full values of the `idx`th row on the page, cells are previews"""
+        if not self.keyset:
+            return self.table.get_row(offset=self.offset + idx,
+                                      order_by=self._order)
+        if idx >= len(self._keys):
+            return None
+        return self.table.get_row(key=self._keys[idx])
+
+    def estimate_total(self):
+        return self.table.estimated_count()
+
+    @property
+    def count_query(self):
+        return self.table.count_query
+
+    @property
+    def export_query(self):
+        return 'select * from %s' % quote_identifier(self.table.name)
+
     def result_desc(self):
         return (x['name'] for x in self.table.desc)
 
@@ -80,15 +497,22 @@ class TableSession(_Session):
         return self.table.name
 
     def default_query(self):
-        return 'select * from %s limit %d' % (self.table.name, self.limit)
+        return 'select * from %s%s limit %d' % \
+            (self.table.name, self.table.order_clause(self._order), self.limit)
 
     def __str__(self):
+        name = self.table.name
+        if self._anchor is not None:
+            name = '%s(%s>=%s)' % (name, ','.join(self.table.seek_key),
+                                   ','.join(str(x) for x in self._anchor))
         if self._result_size:
-            return '%s:%d-%d' % \
-                (self.table.name, self.index_from_1,
-                 self.index_from_1 + self._result_size - 1)
+            return '%s:%d-%d%s' % \
+                (name, self.index_from_1,
+                 self.index_from_1 + self._result_size - 1,
+                 (self._total_string() if self._anchor is None else '') +
+                 self._cached_string())
         else:
-            return '%s:empty' % (self.table.name)
+            return '%s:empty' % name
 
 
 class FreeQuerySession(_Session):
@@ -96,35 +520,210 @@ class FreeQuerySession(_Session):
     __query_digest_max_len = 80
 
     def __init__(self, database, query):
-        super(FreeQuerySession, self).__init__()
+        super(FreeQuerySession, self).__init__(database.option,
+                                               results=database.result_cache)
         self._database = database
         self.query = query
-        self._current_result_desc = None
+        self._server_side = None
+        self._estimate = None
+        self._stream = None
+        self._converter = None
+        self._spill = None # SpillStore of a streamed result
+        self._order = None # (column, descending) rows of the spill are read in
         logger.info('init session: %s' % self.query)
 
     def word_list(self):
         return self._current_result_desc \
             if self._current_result_desc is not None else ()
 
-    def get_list(self):
-        with self._database.new_cursor() as cursor:
-            cursor.execute(self.query)
-            self._current_result_desc = tuple(x[0] for x in cursor.description)
+    @property
+    def server_side(self):
+        if self._server_side is None:
+            mode = self._database.option('stream_results')
+            if mode == 'auto':
+                rows = self.estimate_total()
+                threshold = self._database.option('stream_threshold')
+                self._server_side = rows is not None and rows > threshold
+                logger.info('estimated rows: %s (threshold=%d)' %
+                            (rows, threshold))
+            else:
+                self._server_side = bool(mode)
+        return self._server_side
+
+    def estimate_total(self):
+        if self._estimate is None:
+            self._estimate = (self._database.estimate_rows(self.query),)
+        return self._estimate[0]
 
-            idx = 0
-            ret = []
-            for values in iter(cursor):
-                if idx >= self.offset:
-                    ret.append(tuple(value_optimize(v) for v in values))
-                    if len(ret) > self.limit: # fetch until limit + 1
-                        break
-                idx += 1
+    @property
+    def count_query(self):
+        query = self.query.strip().rstrip(';')
+        if not query.lower().startswith('select'):
+            return None
+        return 'select count(*) from (%s) as _mystique_count' % query
 
-            self._has_next = len(ret) > self.limit
-            if self._has_next:
-                del ret[len(ret) - 1]
+    @property
+    def export_query(self):
+        # run again by the exporter, reads with a result only
+        if normalize_query(self.query) is None or \
+            self._current_result_desc is None:
+                return None
+        return self.query
 
-        return ret
+    def _result_base(self):
+        query = normalize_query(self.query)
+        if query is None or self._order is not None:
+            # sorted pages are read from the spill file, local already
+            return None
+        return ('query', self._database.config('db'), query)
+
+    @property
+    def order(self):
+        return self._order
+
+    def sortable(self, column):
+        spill = self._spill
+        return spill is not None and spill.complete
+
+    @_synchronized
+    def sort(self, column, descending=False):
+        """sorts every row in the spill file, None for the order they came"""
+        self._order = (column, descending) if column is not None else None
+        self.offset = 0
+        self._pages.clear()
+
+    @property
+    def searchable(self):
+        return self._spill is not None
+
+    def find(self, text, start, backward=False):
+        """number of the next row after `start` (before it if `backward`)
+        with `text`, going round once. Only rows in the spill file are
+        looked at."""
+        spill = self._spill
+        if spill is None:
+            return None
+        found = spill.find(text, start, backward=backward)
+        if found is None:
+            found = spill.find(text, len(spill) if backward else -1,
+                               backward=backward)
+        return found
+
+    @property
+    def rows_received(self):
+        stream = self._stream
+        return stream.rows_read if stream is not None else 0
+
+    def _spill_covers(self, offset):
+        spill = self._spill
+        if spill is None:
+            return False
+        if spill.covers(offset, self.limit):
+            return True
+        # the last page read, the held stream tells whether rows follow
+        stream = self._stream
+        return stream is not None and stream.position == len(spill) and \
+            offset + self.limit <= len(spill)
+
+    def _read_page(self, offset, stats):
+        spill = self._spill
+        if self._spill_covers(offset):
+            stats.source = 'spill'
+            stats.start()
+            order = self._order
+            spill.sort(self._current_result_desc.index(order[0])
+                       if order is not None else None,
+                       order is not None and order[1])
+            rows = spill.read(offset, self.limit + 1)
+            has_next = len(rows) > self.limit or \
+                (not spill.complete and self._stream.has_more())
+            ret = self._converter.convert(rows[:self.limit])
+            stats.mark('fetch')
+            return _Page(ret, has_next, widths=ret.widths, nbytes=ret.nbytes)
+        stats.start()
+        held = self._stream is not None and self._stream.position <= offset
+        try:
+            rows, has_next, spilling = self._read_stream(offset, stats)
+        except Exception as e:
+            if not held or not is_gone_away(e):
+                raise
+            # a held unbuffered result is dropped by the server after
+            # net_write_timeout, run it again
+            logger.info('stream has gone away, execute again: %s' % e)
+            rows, has_next, spilling = self._read_stream(offset, stats)
+        if spilling and self._spill.append(rows) and not has_next:
+            self._spill.complete = True
+            self.set_total(len(self._spill), exact=True)
+        if not has_next:
+            self._close_stream()
+        ret = self._converter.convert(rows)
+        stats.mark('fetch')
+        return _Page(ret, has_next, widths=ret.widths, nbytes=ret.nbytes)
+
+    def _read_stream(self, offset, stats):
+        if self._stream is None or self._stream.position > offset:
+            # behind the held cursor and out of the cache, run it again
+            self._open_stream(stats)
+        self._stream.stats = stats
+        spilling = self._spilling
+        try:
+            self._stream.skip(offset - self._stream.position,
+                              sink=self._spill.append if spilling else None)
+            rows = self._stream.fetch(self.limit)
+            has_next = self._stream.has_more()
+        except:
+            self._close_stream()
+            raise
+        return rows, has_next, spilling
+
+    @property
+    def _spilling(self):
+        # every row read from the stream goes to the store while it can
+        return self._spill is not None and not self._spill.full and \
+            self._stream.position == len(self._spill)
+
+    def _open_stream(self, stats):
+        self._close_stream()
+        server_side = self.server_side # may run explain first
+        stats.start()
+        logger.info('execute: %s' % self.query)
+        self._stream = self._database.open_stream(self.query,
+                                                  server_side=server_side,
+                                                  stats=stats)
+        self._current_result_desc = self._stream.description
+        self._converter = RowConverter(self._stream.types)
+        if self._results is not None and normalize_query(self.query) is None:
+            # it may have changed anything, cached results can be stale
+            self._results.clear()
+        if self._spill is None and self._stream.server_side and \
+            self._current_result_desc and self._database.option('spill'):
+                self._spill = SpillStore(
+                    self._current_result_desc,
+                    directory=self._database.option('spill_dir'),
+                    max_bytes=self._database.option('spill_max_bytes'))
+
+    def _close_stream(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def _drop_spill(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    @_synchronized
+    def refresh(self):
+        self._order = None # sorted in the spill file, which is dropped
+        super(FreeQuerySession, self).refresh()
+        self._close_stream()
+        self._drop_spill()
+
+    @_synchronized
+    def close(self):
+        super(FreeQuerySession, self).close()
+        self._close_stream()
+        self._drop_spill()
 
     def default_query(self):
         return self.query
@@ -136,7 +735,62 @@ class FreeQuerySession(_Session):
 
     def __str__(self):
         dest = ' '.join(self.query.split(os.linesep))
-        if len(dest) <= self.__query_digest_max_len:
-            return dest
-        return '%s ...' % (dest[:self.__query_digest_max_len])
+        if len(dest) > self.__query_digest_max_len:
+            dest = '%s ...' % (dest[:self.__query_digest_max_len])
+        return dest + self._total_string() + self._cached_string()
+
+
+class ExplainSession(_Session):
+    """Plan of a query as a tree, one node per row, full scans and
+    filesorts are highlighted"""
 
+    __query_digest_max_len = 60
+
+    def __init__(self, database, query, analyze=False):
+        super(ExplainSession, self).__init__(database.option)
+        self._database = database
+        self.query = query
+        self.analyze = analyze
+        self._plan = None # (rows, indexes of rows with warnings)
+        logger.info('init explain%s: %s' % (' analyze' if analyze else '',
+                                            self.query))
+
+    def _read_page(self, offset, stats):
+        if self._plan is None:
+            text = self._database.explain(self.query, analyze=self.analyze,
+                                          stats=stats)
+            stats.start()
+            root = explain.parse_analyze(text) if self.analyze \
+                else explain.parse_json_plan(text)
+            self._plan = explain.flatten(root)
+            self.set_total(len(self._plan[0]), exact=True)
+            stats.mark('fetch')
+        rows = self._plan[0]
+        return _Page(rows[offset:offset + self.limit],
+                     len(rows) > offset + self.limit)
+
+    def _apply_page(self, page):
+        super(ExplainSession, self)._apply_page(page)
+        self.highlights = set(i - self.offset for i in self._plan[1]
+                              if 0 <= i - self.offset < self.limit)
+
+    @_synchronized
+    def refresh(self):
+        super(ExplainSession, self).refresh()
+        self._plan = None
+
+    def word_list(self):
+        return explain.COLUMNS
+
+    def default_query(self):
+        return self.query
+
+    def result_desc(self):
+        return explain.COLUMNS
+
+    def __str__(self):
+        dest = ' '.join(self.query.split())
+        if len(dest) > self.__query_digest_max_len:
+            dest = '%s ...' % (dest[:self.__query_digest_max_len])
+        return '%s: %s%s' % ('explain analyze' if self.analyze else 'explain',
+                             dest, self._total_string())
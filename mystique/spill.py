@@ -0,0 +1,176 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from mystique.log import logger
+
+
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+
+def _storable(v):
+    # sqlite keeps ints, floats and strings as they are
+    if isinstance(v, (int, long)):
+        # bigint unsigned may not fit in a sqlite integer
+        return v if _INT64[0] <= v <= _INT64[1] else str(v)
+    if v is None or isinstance(v, (float, basestring)):
+        return v
+    return str(v) # decimal, datetime, ...
+
+
+def _sort_key(column, descending):
+    # NULL, numbers, then text as ResultWalker sorts a page
+    c = 'c%d' % column
+    terms = ('%s is not null' % c,
+             "(cast(%s as real) = 0 and trim(%s, '0.-') != '')" % (c, c),
+             'cast(%s as real)' % c,
+             '%s collate nocase' % c)
+    return ', '.join('%s%s' % (x, ' desc' if descending else '')
+                     for x in terms)
+
+
+class SpillStore(object):
+    """Rows of a streamed result written to a local sqlite file as they
+    arrive, numbered from 0. Once over `max_bytes` no more rows are taken
+    and `full` is set, the file is removed by `close`. Once every row is
+    taken they can be sorted by a column, then rows are numbered in that
+    order by `read` and `find`."""
+
+    __row_overhead = 16
+
+    def __init__(self, columns, directory=None, max_bytes=1024 ** 3):
+        self.columns = columns
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.full = False
+        self.complete = False # every row of the result has been taken
+        self._count = 0
+        self._sort = None # (column, descending) rows are read in
+        self._lock = threading.Lock()
+        fd, self.path = tempfile.mkstemp(
+            prefix='mystique-', suffix='.sqlite',
+            dir=os.path.expanduser(directory) if directory else None)
+        os.close(fd)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.text_factory = str
+        self._conn.execute('pragma journal_mode = off')
+        self._conn.execute('pragma synchronous = off')
+        names = ', '.join('c%d' % i for i in range(len(columns)))
+        self._conn.execute('create table rows (n integer primary key, %s)' %
+                           names)
+        self._insert = 'insert into rows values (?, %s)' % \
+            ', '.join('?' * len(columns))
+        self._names = names
+        logger.info('[SPILL] %s' % self.path)
+
+    def __len__(self):
+        return self._count
+
+    def append(self, rows):
+        """takes rows following the last one, False if it is full"""
+        if self.full:
+            return False
+        if not rows:
+            return True
+        values = []
+        size = 0
+        n = self._count
+        for row in rows:
+            row = [_storable(v) for v in row]
+            size += sum(len(v) if isinstance(v, basestring) else 8
+                        for v in row if v is not None) + self.__row_overhead
+            values.append([n] + row)
+            n += 1
+        with self._lock:
+            if self.bytes + size > self.max_bytes:
+                self.full = True
+                logger.info('[SPILL] full at %d rows (%d bytes)' %
+                            (self._count, self.bytes))
+                return False
+            try:
+                with self._conn:
+                    self._conn.executemany(self._insert, values)
+            except (sqlite3.Error, OverflowError) as e:
+                # out of disk or the like, the stream is read as before
+                self.full = True
+                logger.info('[SPILL] can not write %s: %s' % (self.path, e))
+                return False
+            self._count = n
+            self.bytes += size
+        return True
+
+    @property
+    def sort_order(self):
+        return self._sort
+
+    def sort(self, column, descending=False):
+        """rows are read ordered by a column from now, None for the order
+        they came in. Only a complete store can be sorted."""
+        sort = (column, descending) if column is not None else None
+        with self._lock:
+            if sort == self._sort:
+                return
+            if sort is not None and not self.complete:
+                raise ValueError('rows are still arriving')
+            with self._conn:
+                self._conn.execute('drop table if exists sorted')
+                if sort is not None:
+                    self._conn.execute('create table sorted '
+                                       '(pos integer primary key, n integer)')
+                    # pos is numbered from 1 in the order of insert
+                    self._conn.execute(
+                        'insert into sorted (n) select n from rows '
+                        'order by %s, n' % _sort_key(*sort))
+            self._sort = sort
+
+    def read(self, offset, limit):
+        with self._lock:
+            if self._sort is None:
+                sql = 'select %s from rows where n >= ? order by n limit ?'
+            else:
+                sql = 'select %s from sorted join rows on rows.n = sorted.n ' \
+                    'where sorted.pos > ? order by sorted.pos limit ?'
+            return self._conn.execute(sql % self._names,
+                                      (offset, limit)).fetchall()
+
+    def find(self, text, start, backward=False):
+        """number of the first row after `start` (before it if `backward`)
+        with `text` in any column, None if no row has it"""
+        if isinstance(text, unicode):
+            text = text.encode('utf8')
+        pattern = '%%%s%%' % re.sub(r'([%_\\])', r'\\\1', text)
+        match = ' or '.join("c%d like ? escape '\\'" % i
+                            for i in range(len(self.columns)))
+        if self._sort is None:
+            sql = 'select n from rows where n %s ? and (%s) order by n %s ' \
+                'limit 1'
+        else:
+            # pos is numbered from 1
+            start += 1
+            sql = 'select sorted.pos - 1 from sorted join rows ' \
+                'on rows.n = sorted.n where sorted.pos %s ? and (%s) ' \
+                'order by sorted.pos %s limit 1'
+        sql = sql % ('<' if backward else '>', match,
+                     'desc' if backward else 'asc')
+        with self._lock:
+            found = self._conn.execute(
+                sql, [start] + [pattern] * len(self.columns)).fetchone()
+        return found[0] if found else None
+
+    def covers(self, offset, limit):
+        """the page and whether any row follows it can be told by the store"""
+        return self.complete or offset + limit < self._count
+
+    def close(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.close()
+            self._conn = None
+            try:
+                os.remove(self.path)
+            except OSError as e:
+                logger.info('[SPILL] can not remove %s: %s' % (self.path, e))
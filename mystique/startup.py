@@ -0,0 +1,21 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import time
+from mystique.log import logger
+
+
+# imported first by mystique.cli, close enough to the process start
+started_at = time.time()
+
+_marks = [] # [(name, seconds since started_at), ...]
+
+
+def mark(name):
+    """records the first time `name` happened"""
+    if not any(x[0] == name for x in _marks):
+        _marks.append((name, time.time() - started_at))
+        logger.info('[STARTUP] %s: %.3fs' % (name, _marks[-1][1]))
+
+
+def report():
+    return ' '.join('%s=%.3fs' % x for x in _marks)
@@ -0,0 +1,160 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import sys
+import json
+import time
+from collections import OrderedDict
+from mystique import util
+from mystique.log import logger
+
+
+PHASES = ('connect', 'execute', 'fetch', 'render')
+
+# counters of SHOW SESSION STATUS compared before and after a query
+STATUS_VARIABLES = (
+    'Handler_read_first', 'Handler_read_key', 'Handler_read_last',
+    'Handler_read_next', 'Handler_read_prev', 'Handler_read_rnd',
+    'Handler_read_rnd_next', 'Created_tmp_tables', 'Created_tmp_disk_tables',
+    'Sort_merge_passes', 'Bytes_sent',
+)
+
+class _Signal(object):
+    """blinker.signal(name), blinker is imported by the first receiver so
+    the db layer (batch, export, dump) does not need it"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def connect(self, receiver, **kwargs):
+        import blinker
+        return blinker.signal(self.name).connect(receiver, **kwargs)
+
+    def disconnect(self, receiver, **kwargs):
+        import blinker
+        blinker.signal(self.name).disconnect(receiver, **kwargs)
+
+    def send(self, sender):
+        # nobody is connected unless blinker is loaded
+        blinker = sys.modules.get('blinker')
+        if blinker is not None:
+            blinker.signal(self.name).send(sender)
+
+
+# sent with the QueryStats, collectors may connect to them
+query_started = _Signal('query_started')
+query_finished = _Signal('query_finished')
+
+
+def read_status(cursor):
+    cursor.execute('show session status where Variable_name in (%s)' %
+                   ', '.join('%s' for _ in STATUS_VARIABLES), STATUS_VARIABLES)
+    return dict((name, int(value)) for name, value in cursor.fetchall())
+
+
+_overheads = {} # server => deltas of two read_status in a row
+
+
+def status_overhead(cursor, server):
+    """what the reads before and after a query add to its deltas, the
+    bytes sent and the temp table of SHOW STATUS on 5.6/5.7. Measured once
+    per server with two reads in a row."""
+    overhead = _overheads.get(server)
+    if overhead is None:
+        before = read_status(cursor)
+        after = read_status(cursor)
+        overhead = _overheads[server] = dict(
+            (x, after[x] - before[x]) for x in after if x in before)
+    return overhead
+
+
+class QueryStats(object):
+    """Wall time of each phase of reading one page of a result, rows and
+    size of the page and, if it is asked, deltas of the server status"""
+
+    def __init__(self, query, server_status=False):
+        self.query = query
+        self.server_status = server_status
+        self.started_at = time.time()
+        self.phases = OrderedDict((x, 0.0) for x in PHASES)
+        self.page_rows = 0
+        self.page_bytes = 0 # converted values, not bytes on the wire
+        self.status = None # name => delta
+        self.source = 'server' # server | cache | spill
+        self.error = None # of the read which failed
+        self.finished = False
+        self._lap = self.started_at
+        query_started.send(self)
+
+    def start(self):
+        self._lap = time.time()
+
+    def mark(self, name):
+        """the time since the last mark (or start) is spent in `name`"""
+        now = time.time()
+        self.phases[name] += now - self._lap
+        self._lap = now
+
+    def set_status(self, before, after, overhead=None):
+        """deltas of read_status() taken before and after the query, less
+        what the reads of the status add (status_overhead)"""
+        overhead = overhead or {}
+        deltas = ((x, after[x] - before[x] - overhead.get(x, 0))
+                  for x in STATUS_VARIABLES if x in after and x in before)
+        self.status = OrderedDict((x, v) for x, v in deltas if v > 0)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        logger.info('[STATS] %s' % json.dumps(self.as_dict()))
+        query_finished.send(self)
+
+    @property
+    def elapsed(self):
+        return sum(self.phases.values())
+
+    def as_dict(self):
+        return OrderedDict((
+            ('query', self.query),
+            ('source', self.source),
+            ('phases', OrderedDict((k, round(v, 6))
+                                   for k, v in self.phases.items())),
+            ('elapsed', round(self.elapsed, 6)),
+            ('page_rows', self.page_rows),
+            ('page_bytes', self.page_bytes),
+            ('status', self.status),
+            ('error', self.error),
+        ))
+
+    @property
+    def summary(self):
+        parts = ['%s %dms' % (k, v * 1000) for k, v in self.phases.items()]
+        if self.source != 'server':
+            parts.append('(%s)' % self.source)
+        parts.append('page %d rows %sB' %
+                     (self.page_rows, util.human_readable(self.page_bytes)))
+        if self.status:
+            parts.append('|')
+            parts.extend('%s +%d' % x for x in self.status.items())
+        return ' '.join(parts)
+
+
+class _NoStats(QueryStats):
+    """taken by the db layer when nobody collects stats"""
+
+    server_status = False
+
+    def __init__(self):
+        pass
+
+    def start(self):
+        pass
+
+    def mark(self, name):
+        pass
+
+    def set_status(self, before, after, overhead=None):
+        pass
+
+
+NO_STATS = _NoStats()
@@ -7,3 +7,18 @@ def get_once(data, key, default=None):
     if key in data:
         del data[key]
     return v or default
+
+
+def pop_options(data, defaults):
+    return dict((k, data.pop(k, v)) for k, v in defaults.items())
+
+
+def human_readable(n, base=1024, units=('', 'K', 'M', 'G', 'T', 'P')):
+    if n is None:
+        return '-'
+    n = float(n)
+    for unit in units:
+        if abs(n) < base or unit == units[-1]:
+            break
+        n /= base
+    return ('%d%s' if not unit else '%.1f%s') % (n, unit)
@@ -5,6 +5,7 @@ import urwid
 
 from mystique.log import logger
 from mystique import util
+from mystique.wordindex import WordIndex
 
 
 def txt(v, weight=0, align='left'):
@@ -78,6 +79,47 @@ class ErrorMessage(urwid.Text):
         super(ErrorMessage, self).__init__('ERROR! %s' % msg)
 
 
+class Debouncer(object):
+    """Coalesces calls made within `delay` seconds into the last one.
+    Calls through immediately until a main loop is attached."""
+
+    def __init__(self, delay, loop=None):
+        self._delay = delay
+        self._loop = loop
+        self._handle = None
+        self._func = None
+
+    def attach(self, loop):
+        self._loop = loop
+
+    def call(self, func):
+        if self._loop is None:
+            func()
+            return
+        self.cancel()
+        self._func = func
+        self._handle = self._loop.set_alarm_in(self._delay, self._fire)
+
+    def cancel(self):
+        if self._handle is not None:
+            self._loop.remove_alarm(self._handle)
+        self._handle = None
+        self._func = None
+
+    def flush(self):
+        if self._func is not None:
+            func = self._func
+            self.cancel()
+            func()
+
+    def _fire(self, loop=None, user_data=None):
+        func = self._func
+        self._handle = None
+        self._func = None
+        if func is not None:
+            func()
+
+
 class _AutoComplete(urwid.Edit):
 
     def __init__(self, *args, **kwargs):
@@ -85,6 +127,10 @@ class _AutoComplete(urwid.Edit):
         self._current_list = self._word_list
         self._autocompleted = util.get_once(kwargs, 'autocompleted')
         self._match_partical = util.get_once(kwargs, 'match_partical', default=False)
+        self._debouncer = util.get_once(kwargs, 'debouncer')
+        self._last_filter = None # (text, results) to narrow down
+        self._index = WordIndex(self._word_list, key=self._word_of,
+                                rank=self._rank_of)
         super(_AutoComplete, self).__init__(*args, **kwargs)
         self._last_txt = self.get_edit_text()
         self._is_active = False
@@ -97,6 +143,19 @@ class _AutoComplete(urwid.Edit):
     def current_list(self):
         return self._current_list
 
+    def add_words(self, words):
+        if self._index.add(words):
+            self._word_list = self._index.items
+            self._last_filter = None
+
+    @classmethod
+    def _word_of(cls, item):
+        return item
+
+    @classmethod
+    def _rank_of(cls, item):
+        return 0
+
     def get_edit_text(self, *args, **kwargs):
         return super(_AutoComplete, self).\
             get_edit_text(*args, **kwargs).strip()
@@ -105,8 +164,12 @@ class _AutoComplete(urwid.Edit):
         self.set_edit_text('')
 
     def reset(self):
+        if self._debouncer is not None:
+            self._debouncer.cancel()
         self.clear()
         self._current_list = self._word_list
+        self._last_txt = ''
+        self._last_filter = None
 
     def activate(self):
         self._is_active = True
@@ -120,19 +183,33 @@ class _AutoComplete(urwid.Edit):
     def keypress(self, size, key):
         kp = super(_AutoComplete, self).keypress(size, key)
         if self._autocompleted:
-            txt = self.get_edit_text()
-            if txt != self._last_txt:
-                self._current_list = self.do_filter(txt)
-                self._last_txt = txt
-                self._autocompleted(self._current_list)
+            if self._debouncer is not None:
+                self._debouncer.call(self.refilter)
+            else:
+                self.refilter()
         return kp
 
+    def refilter(self, force=False):
+        txt = self.get_edit_text()
+        if force or txt != self._last_txt:
+            self._current_list = self.do_filter(txt)
+            self._last_txt = txt
+            self._autocompleted(self._current_list)
+
     def do_filter(self, val):
-        if self._match_partical:
-            matcher = lambda x:val.lower() in x.lower()
+        last = self._last_filter
+        if last is not None and val.startswith(last[0]):
+            # the text only grew, narrow down the previous results
+            v = val.lower()
+            if self._match_partical:
+                matcher = lambda x:v in self._word_of(x).lower()
+            else:
+                matcher = lambda x:self._word_of(x).lower().startswith(v)
+            ret = [x for x in last[1] if matcher(x)]
         else:
-            matcher = lambda x:x.lower().startswith(val.lower())
-        return filter(matcher, self.word_list)
+            ret = self._index.search(val, partial=self._match_partical)
+        self._last_filter = (val, ret)
+        return ret
 
 
 class TableFilter(urwid.LineBox):
@@ -142,6 +219,26 @@ class TableFilter(urwid.LineBox):
         super(TableFilter, self).__init__(self.body)
 
 
+class _PromptEdit(urwid.Edit):
+
+    def __init__(self, caption, on_enter):
+        super(_PromptEdit, self).__init__(caption)
+        self._on_enter = on_enter
+
+    def keypress(self, size, key):
+        if key == 'enter':
+            self._on_enter(self.get_edit_text().strip())
+            return
+        return super(_PromptEdit, self).keypress(size, key)
+
+
+class Prompt(urwid.LineBox):
+
+    def __init__(self, caption, on_enter):
+        self.body = _PromptEdit(caption, on_enter)
+        super(Prompt, self).__init__(self.body)
+
+
 class TableColumn(urwid.Columns):
 
     def __init__(self, widget_list):
@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 # -*- encoding:utf-8 -*-
 from __future__ import absolute_import
+import re
 import urwid
 from mystique.widgets import _AutoComplete
+from mystique.wordindex import WordIndex
 from mystique.log import logger
 
 
@@ -17,10 +19,61 @@ def with_word_type(words, word_type):
     return tuple(((x, word_type) for x in words))
 
 
+_TOKEN = re.compile(r'`[^`]*`|\w+|[,.()]')
+
+_TABLE_CLAUSES = ('from', 'join', 'update', 'into')
+
+# mysql words that may follow a table reference, not in __sql_words
+_MYSQL_WORDS = ('limit', 'straight_join', 'lock', 'force', 'use', 'ignore',
+                'partition', 'procedure')
+
+
+def _unquote(token):
+    return token.strip('`')
+
+
+def referenced_tables(query, reserved_words=()):
+    """{alias or table name (lower case): table name} of FROM/JOIN clauses"""
+    tokens = _TOKEN.findall(query)
+    n = len(tokens)
+    refs = {}
+
+    def _is_name(i):
+        return i < n and tokens[i] not in (',', '.', '(', ')') and \
+            (tokens[i].startswith('`') or
+             tokens[i].lower() not in reserved_words)
+
+    i = 0
+    while i < n:
+        if tokens[i].lower() not in _TABLE_CLAUSES:
+            i += 1
+            continue
+        i += 1
+        while _is_name(i):
+            table = _unquote(tokens[i])
+            i += 1
+            if i + 1 < n and tokens[i] == '.' and _is_name(i + 1):
+                table = _unquote(tokens[i + 1]) # db.table
+                i += 2
+            refs[table.lower()] = table
+            if i < n and tokens[i].lower() == 'as':
+                i += 1
+            if _is_name(i):
+                refs[_unquote(tokens[i]).lower()] = table
+                i += 1
+            if i < n and tokens[i] == ',':
+                i += 1
+            else:
+                break
+    return refs
+
+
 class _QuerySyntaxAutoComplete(_AutoComplete):
 
     __autocompletable_min_len = 2
 
+    __max_suggestions = 30
+
     __sql_words = ('absolute', 'action', 'add', 'all', 'allocate',
                   'alter', 'and', 'any', 'are', 'as', 'asc', 'assertion',
                   'at', 'authorization', 'avg', 'begin', 'between', 'bit',
@@ -64,7 +117,10 @@ class _QuerySyntaxAutoComplete(_AutoComplete):
                   'with', 'work', 'write', 'year', 'zone', 'count', 'count(*)',
                   'group by', 'order by')
 
+    __reserved_words = frozenset(__sql_words + _MYSQL_WORDS)
+
     def __init__(self, *args, **kwargs):
+        self._column_loader = kwargs.pop('column_loader', None)
         if 'custom_word_list' in kwargs:
             _custom_word_list = kwargs['custom_word_list'] or ()
             del kwargs['custom_word_list']
@@ -80,10 +136,49 @@ class _QuerySyntaxAutoComplete(_AutoComplete):
         super(_QuerySyntaxAutoComplete, self).__init__(*args, **kwargs)
         self.edit_pos_from = -1
         self.edit_pos_to = -1
+        self.qualifier = None
+        self._columns = {} # table name (lower case) => WordIndex
+        self._requested = set()
+        self._refs = (None, {}) # (query, referenced tables)
+
+    def referenced_tables(self, val):
+        if self._refs[0] != val:
+            self._refs = (val, referenced_tables(val, self.__reserved_words))
+        return self._refs[1]
+
+    def add_columns(self, table, columns):
+        """called back by `column_loader` on the main loop"""
+        words = with_word_type(columns, AcWordTypes.column)
+        self._columns[table.lower()] = WordIndex(words, key=self._word_of)
+        self.add_words(words)
+        if self._autocompleted and self.get_possible_word(
+            self.get_edit_text()) is not None:
+                self.refilter(force=True)
+
+    def _columns_failed(self, table):
+        self._requested.discard(table.lower())
+
+    def forget_column_requests(self):
+        """columns which have not arrived are asked again, their loads
+        may have been cancelled"""
+        self._requested.intersection_update(self._columns)
+
+    def _load_columns(self, tables):
+        tables = [x for x in tables if x.lower() not in self._requested]
+        if tables and self._column_loader:
+            self._requested.update(x.lower() for x in tables)
+            self._column_loader(tables, self.add_columns, self._columns_failed)
+
+    def _qualifier_at(self, val, dot):
+        idx = dot
+        while idx > 0 and (val[idx - 1].isalnum() or val[idx - 1] in '_`'):
+            idx -= 1
+        return _unquote(val[idx:dot]) or None
 
     def get_possible_word(self, val):
         self.edit_pos_from = -1
         self.edit_pos_to = -1
+        self.qualifier = None
         val_len = len(val)
         pos = self.edit_pos
         if pos == val_len or (val_len > pos and val[pos] in (' ', '\n')):
@@ -93,6 +188,8 @@ class _QuerySyntaxAutoComplete(_AutoComplete):
                 self.edit_pos_to = pos
                 if val[idx] in (' ', '.', '\n'):
                     self.edit_pos_from = idx + 1
+                    if val[idx] == '.':
+                        self.qualifier = self._qualifier_at(val, idx)
                     return val[self.edit_pos_from:self.edit_pos_to]
                 idx -= 1
         if self.edit_pos_from > -1 and self.edit_pos_to > -1:
@@ -114,19 +211,34 @@ class _QuerySyntaxAutoComplete(_AutoComplete):
         self.set_edit_pos(self.edit_pos_from + len(word) + 1)
 
     def do_filter(self, val):
+        refs = self.referenced_tables(val)
+        self._load_columns(set(refs.values()))
         possible_word = self.get_possible_word(val)
+        if self.qualifier is not None and possible_word is not None:
+            table = refs.get(self.qualifier.lower(), self.qualifier)
+            self._load_columns([table])
+            columns = self._columns.get(table.lower())
+            if columns is None:
+                return []
+            logger.debug('possible_word: "%s.%s"' % (table, possible_word))
+            return columns.search(possible_word,
+                                  limit=self.__max_suggestions,
+                                  exclude_exact=True)
         if not possible_word or \
             len(possible_word) < self.__autocompletable_min_len:
                 return []
-        possible_word = possible_word.lower()
         logger.debug('possible_word: "%s"' % possible_word)
+        return self._index.search(possible_word,
+                                  limit=self.__max_suggestions,
+                                  exclude_exact=True)
 
-        def _match(v):
-            vl = v[0].lower()
-            return vl.startswith(possible_word) and \
-                vl != possible_word
+    @classmethod
+    def _word_of(cls, item):
+        return item[0]
 
-        return filter(_match, self.word_list)
+    @classmethod
+    def _rank_of(cls, item):
+        return item[1]
 
 
 class QuerySuggention(urwid.Columns):
@@ -168,10 +280,14 @@ class QuerySuggention(urwid.Columns):
 
 class QueryEditor(urwid.Pile):
 
-    def __init__(self, query=None, custom_word_list=()):
+    def __init__(self, query=None, custom_word_list=(), column_loader=None,
+                 debouncer=None):
         editor = _QuerySyntaxAutoComplete('', query or '',
                                           autocompleted=self._autocompleted,
-                                          custom_word_list=custom_word_list)
+                                          custom_word_list=custom_word_list,
+                                          column_loader=column_loader,
+                                          debouncer=debouncer)
+        self._debouncer = debouncer
         qs = QuerySuggention(editor=editor, on_select=self.focus_to_top)
         self._editor = urwid.LineBox(urwid.AttrWrap(editor, 'editcp'), 'SQL')
         self._suggestionbox = urwid.LineBox(qs)
@@ -181,7 +297,12 @@ class QueryEditor(urwid.Pile):
         ow = self._editor.original_widget
         return self.optimize_query(ow.get_edit_text())
 
+    def forget_column_requests(self):
+        self._editor.original_widget.forget_column_requests()
+
     def keypress(self, size, key):
+        if key == 'tab' and self._debouncer is not None:
+            self._debouncer.flush() # suggestions for the latest text
         if key == 'tab' and self.suggestbox_is_shown and \
             self.focus_position == 0:
                 self.focus_to_suggestionbox()
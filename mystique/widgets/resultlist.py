@@ -0,0 +1,239 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import urwid
+from collections import OrderedDict
+from mystique.widgets import TableColumn, ftxt, fstxt
+
+
+def _text(v):
+    return v.decode('utf8', 'replace') if isinstance(v, bytes) else v
+
+
+def _lower_line(values):
+    # bytes as they are unless they are mixed with unicode
+    try:
+        return '\0'.join(values).lower()
+    except UnicodeDecodeError:
+        return u'\0'.join(_text(v) for v in values).lower()
+
+
+class LazyWalker(urwid.ListWalker):
+    """Widgets above the items (query editor, prompt...) are kept as they
+    are, the items are made by `_make_item` only when they are displayed"""
+
+    def __init__(self, cache_size=200):
+        self._top = []
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self.focus = 0
+
+    def _item_count(self):
+        return 0 # only the widgets above
+
+    def _make_item(self, idx):
+        return None
+
+    def _clear_cache(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._top) + self._item_count()
+
+    def __getitem__(self, pos):
+        if not isinstance(pos, int) or pos < 0:
+            raise IndexError(pos)
+        if pos < len(self._top):
+            return self._top[pos]
+        return self._item(pos - len(self._top))
+
+    def _item(self, idx):
+        if idx >= self._item_count():
+            raise IndexError(idx)
+        w = self._cache.pop(idx, None)
+        if w is None:
+            w = self._make_item(idx)
+        self._cache[idx] = w
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return w
+
+    def set_focus(self, pos):
+        self.focus = pos
+        self._modified()
+
+    def next_position(self, pos):
+        if pos + 1 >= len(self):
+            raise IndexError(pos)
+        return pos + 1
+
+    def prev_position(self, pos):
+        if pos <= 0:
+            raise IndexError(pos)
+        return pos - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self) - 1, -1, -1)
+        return range(len(self))
+
+    def insert(self, pos, widget):
+        if pos > len(self._top):
+            raise IndexError('can insert above the items only')
+        self._top.insert(pos, widget)
+        if self.focus >= pos:
+            self.focus += 1
+        self._modified()
+
+    def __delitem__(self, pos):
+        if pos >= len(self._top):
+            raise IndexError('can delete widgets above the items only')
+        del self._top[pos]
+        if self.focus > pos:
+            self.focus -= 1
+        self._modified()
+
+
+class ResultWalker(LazyWalker):
+    """Holds raw rows and builds a TableColumn only when it is displayed,
+    with the columns that fit in the screen from `column_offset`"""
+
+    __divide_chars = 2 # same as TableColumn
+
+    def __init__(self, names, rows, offset, sizemap, column_offset=0,
+                 cache_size=200, highlights=()):
+        super(ResultWalker, self).__init__(cache_size=cache_size)
+        self._names = names
+        self._rows = rows
+        self._offset = offset
+        self._sizemap = sizemap
+        self._idx_col_len = len(str(len(rows) + offset))
+        self._column_offset = min(column_offset, max(len(names) - 1, 0))
+        self._width = None
+        self._columns = None
+        self._order = None # row indexes in display order when sorted
+        self._sort = None # (column, descending) marked in the header
+        self._sort_keys = {} # column => key of each row
+        self._lowers = None # lowercase text of each row for search
+        self._highlights = highlights # indexes of rows to stand out
+
+    @property
+    def rows(self):
+        return self._rows
+
+    @property
+    def column_offset(self):
+        return self._column_offset
+
+    def set_width(self, width):
+        if width != self._width:
+            self._width = width
+            self._reset_columns()
+
+    def scroll_columns(self, delta):
+        offset = max(0, min(self._column_offset + delta, len(self._names) - 1))
+        if offset == self._column_offset:
+            return False
+        self._column_offset = offset
+        self._reset_columns()
+        self._modified()
+        return True
+
+    def _reset_columns(self):
+        self._columns = None
+        self._clear_cache()
+
+    @property
+    def visible_columns(self):
+        if self._columns is None:
+            columns = []
+            avail = (self._width or 0) - self._idx_col_len
+            for i in range(self._column_offset, len(self._names)):
+                avail -= self._sizemap[i] + self.__divide_chars
+                if columns and avail < 0:
+                    break
+                columns.append(i)
+            self._columns = columns
+        return self._columns
+
+    def row_index(self, pos):
+        """index in rows of a position in the walker, None if not a row"""
+        idx = pos - len(self._top) - 1
+        if not 0 <= idx < len(self._rows):
+            return None
+        return self._order[idx] if self._order is not None else idx
+
+    def position_of(self, idx):
+        """position in the walker of the `idx`th row displayed"""
+        return len(self._top) + 1 + idx
+
+    @property
+    def sort_order(self):
+        return self._sort
+
+    def sort(self, column, descending=False, rows_sorted=False):
+        """sorts rows by a column, None for the order they came in.
+        `rows_sorted` only marks the header for rows sorted by the server"""
+        self._sort = (column, descending) if column is not None else None
+        if column is None or rows_sorted:
+            self._order = None
+        else:
+            keys = self._sort_keys.get(column)
+            if keys is None:
+                keys = self._sort_keys[column] = \
+                    [self._sort_key(values[column]) for values in self._rows]
+            self._order = sorted(range(len(self._rows)),
+                                 key=keys.__getitem__, reverse=descending)
+        self._clear_cache()
+        self._modified()
+
+    @classmethod
+    def _sort_key(cls, v):
+        # NULL (''), numbers, then text
+        if v == '':
+            return (0, 0, v)
+        try:
+            return (1, float(v), v)
+        except ValueError:
+            return (2, 0, v.lower())
+
+    def search(self, text):
+        """positions in display order of rows with `text` in any column"""
+        if self._lowers is None:
+            self._lowers = [_lower_line(values) for values in self._rows]
+        text = _text(text).lower()
+        texts = {bytes: text.encode('utf8'), type(text): text}
+        lowers = [(x, texts.get(type(x), text)) for x in self._lowers]
+        if self._order is not None:
+            lowers = [lowers[x] for x in self._order]
+        return [i for i, (x, t) in enumerate(lowers) if t in x]
+
+    def _item_count(self):
+        return 1 + len(self._rows) # header + rows
+
+    def _make_item(self, idx):
+        if idx == 0:
+            return urwid.AttrWrap(self._make_header(), 'col_head')
+        return self._make_row(idx - 1)
+
+    def _make_header(self):
+        names = (ftxt('<' if self._column_offset else '', self._idx_col_len),) + \
+            tuple(fstxt(self._header_name(i), self._sizemap[i])
+                  for i in self.visible_columns)
+        return TableColumn(names)
+
+    def _header_name(self, i):
+        if self._sort is None or self._sort[0] != i:
+            return self._names[i]
+        return '%s%s' % ('v' if self._sort[1] else '^', self._names[i])
+
+    def _make_row(self, idx):
+        if self._order is not None:
+            idx = self._order[idx]
+        index_str = str(idx + 1 + self._offset)
+        values = self._rows[idx]
+        line = (ftxt(index_str, self._idx_col_len),) + \
+            tuple(fstxt(values[i], self._sizemap[i])
+                  for i in self.visible_columns)
+        if idx in self._highlights:
+            return urwid.AttrWrap(TableColumn(line), 'warn_row')
+        return TableColumn(line)
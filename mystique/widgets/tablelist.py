@@ -0,0 +1,62 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import urwid
+from mystique import util
+from mystique.widgets import StupidButton
+from mystique.widgets.resultlist import LazyWalker
+
+
+class TableListWalker(LazyWalker):
+    """Buttons of table names, made only for the tables on the screen.
+    `status` is {table name: (estimated rows, data size)} if it is known."""
+
+    __rows_len = 8
+
+    __size_len = 8
+
+    def __init__(self, tables, on_select, cache_size=200):
+        super(TableListWalker, self).__init__(cache_size=cache_size)
+        self._tables = tables
+        self._on_select = on_select
+        self._name_len = max([len(x) for x in tables] or [1])
+        self._status = None
+
+    @property
+    def tables(self):
+        return self._tables
+
+    def clear_top(self):
+        self._top = []
+        self.focus = 0
+
+    def set_tables(self, tables):
+        self._tables = tables
+        self._clear_cache()
+        if self.focus >= len(self):
+            self.focus = max(len(self) - 1, 0)
+        self._modified()
+
+    def set_status(self, status):
+        self._status = status
+        self._clear_cache()
+        self._modified()
+
+    def _item_count(self):
+        return len(self._tables)
+
+    def _make_item(self, idx):
+        name = self._tables[idx]
+        btn = urwid.AttrWrap(StupidButton(name, self._on_select),
+                             'buttn', 'buttnf')
+        status = self._status and self._status.get(name)
+        if not status:
+            return urwid.Padding(btn, align='left',
+                                 width=('relative', self._name_len))
+        rows, size = status
+        return urwid.Columns([
+            ('fixed', self._name_len + 4, btn),
+            ('fixed', self.__rows_len, urwid.Text(
+                util.human_readable(rows, base=1000), align='right')),
+            ('fixed', self.__size_len, urwid.Text(
+                util.human_readable(size) + 'B', align='right'))
+        ], dividechars=1)
@@ -0,0 +1,88 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+from bisect import bisect_left
+
+
+class WordIndex(object):
+    """Prefix (sorted array + bisect) and substring (n-gram) index of words.
+
+    `key` takes the word out of an item, `rank` orders capped results.
+    """
+
+    __ngram = 3
+
+    def __init__(self, items=(), key=None, rank=None):
+        self._key = key or (lambda x:x)
+        self._rank = rank or (lambda x:0)
+        self._items = []
+        self._lowers = []
+        self._seen = set()
+        self._sorted = [] # [(lower word, item id), ...]
+        self._grams = {} # n-gram => set of item ids
+        self.add(items)
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def items(self):
+        return list(self._items)
+
+    def add(self, items):
+        new = []
+        for item in items:
+            if item in self._seen:
+                continue
+            self._seen.add(item)
+            i = len(self._items)
+            lower = self._key(item).lower()
+            self._items.append(item)
+            self._lowers.append(lower)
+            new.append((lower, i))
+            for g in self._grams_of(lower):
+                self._grams.setdefault(g, set()).add(i)
+        if new:
+            # merging two sorted runs is linear with timsort
+            new.sort()
+            self._sorted.extend(new)
+            self._sorted.sort()
+        return len(new)
+
+    @classmethod
+    def _grams_of(cls, lower):
+        n = cls.__ngram
+        return set(lower[i:i + n] for i in range(len(lower) - n + 1))
+
+    def _prefix_ids(self, text):
+        ids = []
+        pos = bisect_left(self._sorted, (text,))
+        while pos < len(self._sorted) and \
+            self._sorted[pos][0].startswith(text):
+                ids.append(self._sorted[pos][1])
+                pos += 1
+        return ids
+
+    def _substring_ids(self, text):
+        if len(text) < self.__ngram:
+            return [i for i, x in enumerate(self._lowers) if text in x]
+        sets = sorted((self._grams.get(g, set())
+                       for g in self._grams_of(text)), key=len)
+        ids = set.intersection(*sets) if sets else set()
+        return [i for i in ids if text in self._lowers[i]]
+
+    def search(self, text, partial=False, limit=None, exclude_exact=False):
+        text = text.lower()
+        prefixed = self._prefix_ids(text)
+        ids = set(prefixed)
+        if partial:
+            ids.update(self._substring_ids(text))
+        if exclude_exact:
+            ids = set(i for i in ids if self._lowers[i] != text)
+        if limit is None:
+            return [self._items[i] for i in sorted(ids)]
+        prefixed = set(prefixed)
+        ranked = sorted(ids, key=lambda i:(i not in prefixed,
+                                           self._rank(self._items[i]),
+                                           len(self._lowers[i]),
+                                           self._lowers[i]))
+        return [self._items[i] for i in ranked[:limit]]
@@ -0,0 +1,60 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import os
+import threading
+from collections import deque
+from Queue import Queue, Empty
+from mystique.log import logger
+
+
+class BackgroundWorker(object):
+
+    def __init__(self, name='mystique-worker'):
+        self._jobs = Queue()
+        self._done = deque()
+        self._pipe = None
+        self._thread = threading.Thread(target=self._run, name=name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def thread(self):
+        return self._thread
+
+    def attach(self, loop):
+        """deliver callbacks on the urwid main loop instead of the worker"""
+        self._pipe = loop.watch_pipe(self._deliver)
+
+    def submit(self, job, callback=None, errback=None):
+        self._jobs.put((job, callback, errback))
+
+    def cancel_pending(self):
+        try:
+            while True:
+                self._jobs.get_nowait()
+        except Empty:
+            pass
+
+    def _run(self):
+        while True:
+            job, callback, errback = self._jobs.get()
+            try:
+                done = (callback, job())
+            except Exception as e:
+                logger.error('[WORKER] %s' % e)
+                done = (errback, e)
+            if done[0] is not None:
+                self._done.append(done)
+                self._notify()
+
+    def _notify(self):
+        if self._pipe is None:
+            self._deliver()
+        else:
+            os.write(self._pipe, b'.')
+
+    def _deliver(self, data=None):
+        while self._done:
+            func, value = self._done.popleft()
+            func(value)
+        return True
@@ -42,6 +42,6 @@ setup(
     include_package_data = True,
     entry_points="""
     [console_scripts]
-    mystique=mystique.mystique:main
+    mystique=mystique.cli:main
     """
 )
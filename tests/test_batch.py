@@ -0,0 +1,97 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+from contextlib import contextmanager
+from io import BytesIO
+import MySQLdb
+from mystique.batch import BatchRunner, split_statements
+
+
+class SplitStatementsTest(unittest.TestCase):
+
+    def test_split_and_stripped(self):
+        self.assertEqual(split_statements('select 1;\n select 2 ;;\n'),
+                         ['select 1', 'select 2'])
+        self.assertEqual(split_statements('select 1'), ['select 1'])
+        self.assertEqual(split_statements(' ; \n'), [])
+
+    def test_semicolon_in_quotes(self):
+        self.assertEqual(
+            split_statements('''insert into t values ('a;b', "c;d");'''
+                             '''select `x;y` from t'''),
+            ['''insert into t values ('a;b', "c;d")''',
+             'select `x;y` from t'])
+
+    def test_escaped_quote(self):
+        self.assertEqual(split_statements(r"select 'it\'s;'; select 2"),
+                         [r"select 'it\'s;'", 'select 2'])
+        self.assertEqual(split_statements(r"select `a\`; select 2"),
+                         [r"select `a\`", 'select 2'])
+
+    def test_comments(self):
+        self.assertEqual(
+            split_statements('-- first; not split\nselect 1; # a;b\n'
+                             'select /* ; */ 2;--\nselect 3'),
+            ['select 1', 'select   2', 'select 3'])
+
+    def test_double_dash_without_space_is_no_comment(self):
+        self.assertEqual(split_statements('select 1--1; select 2'),
+                         ['select 1--1', 'select 2'])
+
+
+class _Cursor(object):
+
+    description = None
+    rowcount = 1
+
+    def execute(self, statement):
+        if 'bad' in statement:
+            raise MySQLdb.ProgrammingError(1064, 'syntax error')
+
+    def close(self):
+        pass
+
+
+class _Conn(object):
+
+    def cursor(self, cls=None):
+        return _Cursor()
+
+    def commit(self):
+        pass
+
+
+class _Pool(object):
+
+    @contextmanager
+    def connection(self):
+        yield _Conn()
+
+
+class _Database(object):
+
+    pool = _Pool()
+
+
+class BatchRunnerTest(unittest.TestCase):
+
+    def test_quiet_still_reports_errors(self):
+        err = BytesIO()
+        runner = BatchRunner(_Database(), out=BytesIO(), force=True, err=err)
+        self.assertEqual(runner.run(['update t set a = 1', 'bad one',
+                                     'update t set a = 2']), 1)
+        self.assertEqual(err.getvalue(),
+                         '-- [2] ERROR 1064, syntax error\nbad one\n')
+        self.assertEqual(len(runner.timings), 2)
+
+    def test_timings_go_to_log(self):
+        log, err = BytesIO(), BytesIO()
+        runner = BatchRunner(_Database(), out=BytesIO(), log=log, err=err)
+        self.assertRaises(MySQLdb.Error, runner.run,
+                          ['update t set a = 1', 'bad', 'update t set a = 2'])
+        self.assertTrue(log.getvalue().startswith('-- [1] 1 rows affected'))
+        self.assertTrue(err.getvalue().startswith('-- [2] ERROR'))
+
+
+if __name__ == '__main__':
+    unittest.main()
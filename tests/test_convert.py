@@ -0,0 +1,46 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import datetime
+import decimal
+import unittest
+from MySQLdb.constants import FIELD_TYPE
+from mystique.convert import RowConverter
+
+
+class RowConverterTest(unittest.TestCase):
+
+    def test_by_column_type(self):
+        converter = RowConverter([FIELD_TYPE.LONG, FIELD_TYPE.VAR_STRING,
+                                  FIELD_TYPE.NEWDECIMAL, FIELD_TYPE.DATETIME,
+                                  FIELD_TYPE.DOUBLE])
+        rows = converter.convert([
+            (1, 'a', decimal.Decimal('1.50'),
+             datetime.datetime(2020, 1, 2, 3, 4, 5), 0.5),
+            (None, None, None, None, None)])
+        self.assertEqual(list(rows),
+                         [('1', 'a', '1.50', '2020-01-02 03:04:05', '0.5'),
+                          ('', '', '', '', '')])
+
+    def test_widths_and_bytes(self):
+        rows = RowConverter([FIELD_TYPE.LONG, FIELD_TYPE.VAR_STRING]).convert(
+            [(7, u'日本語'), (12345, 'ab')])
+        self.assertEqual(rows.widths, [5, 3])
+        self.assertEqual(rows.nbytes, 1 + 3 + 5 + 2)
+
+    def test_unknown_type(self):
+        rows = RowConverter([-1]).convert([(u'x',), (3,), (None,)])
+        self.assertEqual(list(rows), [(u'x',), ('3',), ('',)])
+
+    def test_of_description(self):
+        description = (('id', FIELD_TYPE.LONGLONG, None, None, None, None, 0),)
+        rows = RowConverter.of(description).convert([(2 ** 64 - 1,)])
+        self.assertEqual(list(rows), [(str(2 ** 64 - 1),)])
+
+    def test_no_rows(self):
+        rows = RowConverter([FIELD_TYPE.LONG]).convert([])
+        self.assertEqual((list(rows), rows.widths, rows.nbytes),
+                         ([], None, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+from mystique.db import keyset_condition
+
+
+class KeysetConditionTest(unittest.TestCase):
+
+    def test_one_column(self):
+        self.assertEqual(keyset_condition(('id',), (5,), '>'),
+                         ('(`id` > %s)', (5,)))
+
+    def test_columns_after(self):
+        self.assertEqual(
+            keyset_condition(('a', 'b'), (1, 2), '>'),
+            ('(`a` > %s) or (`a` = %s and `b` > %s)', (1, 1, 2)))
+
+    def test_since_is_strict_but_on_the_last_column(self):
+        cond, params = keyset_condition(('a', 'b', 'c'), ('x', 'y', 'z'), '>=')
+        self.assertEqual(cond, '(`a` > %s) or (`a` = %s and `b` > %s) or '
+                               '(`a` = %s and `b` = %s and `c` >= %s)')
+        self.assertEqual(params, ('x', 'x', 'y', 'x', 'y', 'z'))
+
+    def test_before_and_quoting(self):
+        self.assertEqual(
+            keyset_condition(('user id', 'x`y'), (1, 2), '<'),
+            ('(`user id` < %s) or (`user id` = %s and `x``y` < %s)',
+             (1, 1, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import json
+import unittest
+from mystique import explain
+
+
+_JSON_PLAN = json.dumps({
+    'query_block': {
+        'select_id': 1,
+        'cost_info': {'query_cost': '1258.40'},
+        'ordering_operation': {
+            'using_temporary_table': True,
+            'using_filesort': True,
+            'nested_loop': [
+                {'table': {'table_name': 'u', 'access_type': 'ALL',
+                           'rows_examined_per_scan': 1000,
+                           'filtered': '10.00',
+                           'cost_info': {'prefix_cost': '101.25'}}},
+                {'table': {'table_name': u'注文', 'access_type': 'ref',
+                           'key': u'ユーザ',
+                           'rows_examined_per_scan': 3, 'filtered': '100.00',
+                           'using_index': True,
+                           'cost_info': {'prefix_cost': '1158.40'}}},
+            ],
+        },
+        'select_list_subqueries': [
+            {'dependent': True, 'query_block': {
+                'select_id': 2,
+                'table': {'table_name': 't', 'access_type': 'eq_ref',
+                          'key': 'PRIMARY', 'rows_examined_per_scan': 1}}},
+        ],
+    },
+}, sort_keys=True)
+
+_ANALYZE = """\
+-> Sort: o.created DESC  (cost=1158.40 rows=3000) (actual time=5.1..5.3 rows=250 loops=1)
+    -> Nested loop inner join  (cost=1158.40 rows=3000) (actual time=0.1..4.9 rows=250 loops=1)
+        -> Filter: (u.active = 1)  (cost=101.25 rows=100) (actual time=0.05..1.2 rows=90 loops=1)
+            -> Table scan on u  (cost=101.25 rows=1000) (actual time=0.04..0.9 rows=1000 loops=1)
+        -> Index lookup on o using idx_user (user_id=u.id)  (cost=10.0 rows=3) (never executed)
+"""
+
+
+class ParseJsonPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = explain.parse_json_plan(_JSON_PLAN)
+
+    def test_query_block(self):
+        self.assertEqual(self.root.label, 'select #1')
+        self.assertEqual(self.root.cost, '1258.40')
+
+    def test_filesort(self):
+        order = [x for x in self.root.children if x.label == 'order'][0]
+        self.assertTrue(order.warning)
+        self.assertEqual(order.notes, ['filesort', 'temporary'])
+
+    def test_tables(self):
+        order = [x for x in self.root.children if x.label == 'order'][0]
+        scan, lookup = order.children
+        self.assertEqual((scan.label, scan.access, scan.rows, scan.cost),
+                         ('u', 'ALL', '1000', '101.25'))
+        self.assertTrue(scan.warning)
+        self.assertEqual(scan.notes, ['full scan', 'filtered 10.00%'])
+        self.assertEqual((lookup.label, lookup.key),
+                         (u'注文', u'ユーザ'))
+        self.assertFalse(lookup.warning)
+        self.assertEqual(lookup.notes, ['using index'])
+
+    def test_subquery(self):
+        block = [x for x in self.root.children if x.label == 'select #2'][0]
+        self.assertEqual(block.children[0].key, 'PRIMARY')
+
+    def test_union_has_a_root(self):
+        text = json.dumps({'query_block': {'union_result': {
+            'query_specifications': [
+                {'query_block': {'select_id': 1}},
+                {'query_block': {'select_id': 2}}]}}})
+        union = explain.parse_json_plan(text).children[0]
+        self.assertEqual(union.label, 'union')
+        self.assertEqual([x.label for x in union.children],
+                         ['select #1', 'select #2'])
+
+
+class ParseAnalyzeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = explain.parse_analyze(_ANALYZE)
+
+    def test_tree(self):
+        self.assertEqual(self.root.label, 'Sort: o.created DESC')
+        join, = self.root.children
+        self.assertEqual([x.label for x in join.children],
+                         ['Filter: (u.active = 1)',
+                          'Index lookup on o using idx_user (user_id=u.id)'])
+        self.assertEqual(join.children[0].children[0].label, 'Table scan on u')
+
+    def test_rows_and_cost(self):
+        self.assertEqual(self.root.rows, '250 (~3000)')
+        self.assertEqual(self.root.cost, '1158.40')
+        self.assertEqual(self.root.notes, ['filesort', 'actual 5.3ms x1'])
+
+    def test_warnings(self):
+        scan = self.root.children[0].children[0].children[0]
+        self.assertTrue(scan.warning)
+        self.assertTrue(self.root.warning)
+        self.assertFalse(self.root.children[0].warning)
+
+    def test_never_executed(self):
+        lookup = self.root.children[0].children[1]
+        self.assertEqual(lookup.rows, '3')
+        self.assertEqual(lookup.notes, ['never executed'])
+
+
+class FlattenTest(unittest.TestCase):
+
+    def test_tree_and_highlights(self):
+        rows, warnings = explain.flatten(explain.parse_json_plan(_JSON_PLAN))
+        self.assertEqual([x[0] for x in rows],
+                         ['select #1',
+                          '|- order',
+                          '|  |- u',
+                          u'|  `- 注文',
+                          '`- select #2',
+                          '   `- t'])
+        self.assertEqual(warnings, set([1, 2]))
+        self.assertTrue(all(len(x) == len(explain.COLUMNS) for x in rows))
+        self.assertEqual(rows[3][2], u'ユーザ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+from mystique.widgets.queryeditor import QueryEditor, referenced_tables
+
+
+class ReferencedTablesTest(unittest.TestCase):
+
+    def test_from_and_join(self):
+        self.assertEqual(
+            referenced_tables('select * from users u join orders as o '
+                              'on u.id = o.user_id',
+                              reserved_words=('on',)),
+            {'users': 'users', 'u': 'users', 'orders': 'orders',
+             'o': 'orders'})
+
+    def test_comma_list_db_and_quotes(self):
+        self.assertEqual(
+            referenced_tables('select 1 from shop.Items i, `Order Lines`',
+                              reserved_words=('where',)),
+            {'items': 'Items', 'i': 'Items',
+             'order lines': 'Order Lines'})
+
+    def test_reserved_word_is_no_alias(self):
+        self.assertEqual(
+            referenced_tables('select * from t where a = 1',
+                              reserved_words=('where',)),
+            {'t': 't'})
+
+    def test_update_and_insert(self):
+        self.assertEqual(referenced_tables('update t set a = 1',
+                                           reserved_words=('set',)),
+                         {'t': 't'})
+        self.assertEqual(referenced_tables('insert into t values (1)',
+                                           reserved_words=('values',)),
+                         {'t': 't'})
+
+
+class ColumnLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.loads = [] # (tables, on_loaded, on_failed)
+        self.editor = QueryEditor(
+            query='select * from users u',
+            column_loader=lambda *args:self.loads.append(args))
+        self.edit = self.editor._editor.original_widget
+
+    def _filter(self, text):
+        self.edit.set_edit_text(text)
+        self.edit.set_edit_pos(len(text))
+        self.edit.do_filter(text)
+
+    def test_asked_once(self):
+        self._filter('select * from users u')
+        self._filter('select * from users u where u.')
+        self.assertEqual([x[0] for x in self.loads], [['users']])
+
+    def test_loaded_columns_are_suggested(self):
+        self._filter('select * from users u')
+        tables, on_loaded, _ = self.loads[0]
+        on_loaded('users', ['id', 'name', 'nickname'])
+        text = 'select u.n from users u'
+        self.edit.set_edit_text(text)
+        self.edit.set_edit_pos(len('select u.n'))
+        self.assertEqual([x[0] for x in self.edit.do_filter(text)],
+                         ['name', 'nickname'])
+
+    def test_asked_again_after_failure(self):
+        self._filter('select * from users')
+        self.loads[0][2]('users')
+        self._filter('select * from users')
+        self.assertEqual(len(self.loads), 2)
+
+    def test_asked_again_after_cancel(self):
+        self._filter('select * from users, items')
+        self.loads[0][1]('items', ['id'])
+        self.editor.forget_column_requests()
+        self._filter('select * from users, items')
+        self.assertEqual([sorted(x[0]) for x in self.loads],
+                         [['items', 'users'], ['users']])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+from mystique.resultcache import ResultCache, normalize_query
+
+
+class NormalizeQueryTest(unittest.TestCase):
+
+    def test_whitespace_and_comments(self):
+        self.assertEqual(
+            normalize_query('  select *\n\tfrom t -- all\n'
+                            'where /* x */ a = 1 # one\n ;'),
+            'select * from t where a = 1')
+
+    def test_quotes_are_kept(self):
+        self.assertEqual(
+            normalize_query("select 'a  -- b',  `c  d` from t where e='#'"),
+            "select 'a  -- b', `c  d` from t where e='#'")
+        self.assertEqual(normalize_query(r"select 'it\'s  ok'"),
+                         r"select 'it\'s  ok'")
+
+    def test_read_only_statements(self):
+        for query in ('SHOW tables', 'desc t', 'explain select 1',
+                      '(select 1) union (select 2)',
+                      'with x as (select 1) select * from x'):
+            self.assertEqual(normalize_query(query), query)
+
+    def test_not_cacheable(self):
+        for query in ('update t set a = 1', 'insert into t values (1)',
+                      'select * from t for update',
+                      'select * from t lock in share mode',
+                      'select 1 into @x', '-- only a comment'):
+            self.assertEqual(normalize_query(query), None)
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_get_and_put(self):
+        cache = ResultCache(max_bytes=100, ttl=60)
+        self.assertEqual(cache.get(('q', 0)), None)
+        cache.put(('q', 0), 'rows', 10)
+        value, stored_at = cache.get(('q', 0))
+        self.assertEqual(value, 'rows')
+        cache.put(('q', 0), 'new rows', 20)
+        self.assertEqual(cache.stats, dict(entries=1, bytes=20))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = ResultCache(max_bytes=30, ttl=60)
+        cache.put('a', 1, 10)
+        cache.put('b', 2, 10)
+        cache.put('c', 3, 10)
+        cache.get('a')
+        cache.put('d', 4, 10)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual([cache.get(x)[0] for x in 'acd'], [1, 3, 4])
+        self.assertEqual(cache.stats, dict(entries=3, bytes=30))
+
+    def test_too_large_is_not_stored(self):
+        cache = ResultCache(max_bytes=30, ttl=60)
+        cache.put('a', 1, 31)
+        self.assertEqual(cache.stats, dict(entries=0, bytes=0))
+
+    def test_expired(self):
+        cache = ResultCache(max_bytes=30, ttl=-1)
+        cache.put('a', 1, 10)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.stats, dict(entries=0, bytes=0))
+
+    def test_forget_every_page_of_a_result(self):
+        cache = ResultCache(max_bytes=100, ttl=60)
+        cache.put((('q', 1), 0), 'p0', 10)
+        cache.put((('q', 1), 10), 'p1', 10)
+        cache.put((('q', 2), 0), 'other', 10)
+        cache.forget(('q', 1))
+        self.assertEqual(cache.stats, dict(entries=1, bytes=10))
+        self.assertEqual(cache.get((('q', 2), 0))[0], 'other')
+
+
+if __name__ == '__main__':
+    unittest.main()
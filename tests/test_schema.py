@@ -0,0 +1,70 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from mystique.schema import SchemaCache
+
+
+class _Database(object):
+
+    def config(self, name):
+        return 'd'
+
+
+class _CountingCache(SchemaCache):
+
+    save_delay = 60
+
+    def __init__(self, *args, **kwargs):
+        self.saves = 0
+        SchemaCache.__init__(self, *args, **kwargs)
+
+    def save(self):
+        self.saves += 1
+        SchemaCache.save(self)
+
+
+class PutColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = _CountingCache(_Database(), 'alias', cache_dir=self.dir)
+        self.path = os.path.join(self.dir, 'alias.json')
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.dir)
+
+    def test_saved_once_on_close(self):
+        for name in ('a', 'b', 'c'):
+            self.cache.put_columns(name, [['id', 'int']])
+        self.assertEqual(self.cache.saves, 0)
+        self.assertEqual(self.cache.columns('b'), [['id', 'int']])
+        self.cache.close()
+        self.cache.close()
+        self.assertEqual(self.cache.saves, 1)
+        with open(self.path) as f:
+            tables = json.load(f)['dbs']['d']['tables']
+        self.assertEqual(sorted(tables), ['a', 'b', 'c'])
+
+    def test_saved_by_the_timer(self):
+        self.cache.save_delay = 0.01
+        self.cache.put_columns('a', [['id', 'int']])
+        timer = self.cache._timer
+        timer.join(5)
+        self.assertEqual(self.cache.saves, 1)
+        self.assertTrue(os.path.exists(self.path))
+        self.cache.put_columns('b', [['id', 'int']])
+        self.assertFalse(self.cache._timer is timer)
+
+    def test_nothing_saved_without_a_path(self):
+        cache = _CountingCache(_Database(), 'alias')
+        cache.put_columns('a', [['id', 'int']])
+        self.assertTrue(cache._timer is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+import MySQLdb
+from mystique.convert import Rows
+from mystique.db import DEFAULT_OPTIONS
+from mystique.session import FreeQuerySession, TableSession
+from mystique import stats
+from mystique.stats import NO_STATS
+
+
+class _Table(object):
+    """rows of ids 1..count, read as db.Table reads them by key"""
+
+    name = 't'
+    seek_key = ('id',)
+    result_cache = None
+
+    def __init__(self, count, page_size=10, **options):
+        self.ids = list(range(1, count + 1))
+        self.error = None # raised by the next read
+        self._options = dict(DEFAULT_OPTIONS, page_size=page_size, **options)
+
+    def option(self, name):
+        return self._options[name]
+
+    def config(self, name):
+        return 'd'
+
+    def order_clause(self, order_by):
+        return ''
+
+    def seek_list(self, limit=100, after=None, before=None, since=None,
+                  offset=0, stats=NO_STATS):
+        if self.error is not None:
+            raise self.error
+        ids = self.ids
+        if after is not None:
+            ids = [x for x in ids if x > after[0]]
+        elif since is not None:
+            ids = [x for x in ids if x >= since[0]]
+        elif before is not None:
+            ids = [x for x in ids if x < before[0]][-limit:]
+        ids = ids[offset:offset + limit]
+        rows = Rows([(str(x),) for x in ids], widths=[3], nbytes=len(ids))
+        return rows, [(x,) for x in ids]
+
+
+class _Stream(object):
+    """db.ResultStream over a list, `error` is raised by the next fetch"""
+
+    description = ('id',)
+    types = (None,)
+
+    def __init__(self, rows, server_side):
+        self.server_side = server_side
+        self.stats = NO_STATS
+        self.position = 0
+        self.rows_read = 0
+        self.error = None
+        self._rows = rows
+
+    def fetch(self, size):
+        if self.error is not None:
+            raise self.error
+        rows = self._rows[self.position:self.position + size]
+        self.position += len(rows)
+        self.rows_read = self.position
+        return rows
+
+    def has_more(self):
+        return self.position < len(self._rows)
+
+    def skip(self, count, sink=None):
+        rows = self.fetch(count)
+        if sink is not None:
+            sink(rows)
+
+    def close(self):
+        pass
+
+
+class _Database(object):
+
+    result_cache = None
+
+    def __init__(self, count, page_size=10):
+        self.rows = [(x,) for x in range(1, count + 1)]
+        self.streams = []
+        self._options = dict(DEFAULT_OPTIONS, page_size=page_size,
+                             stream_results=True)
+
+    def option(self, name):
+        return self._options[name]
+
+    def config(self, name):
+        return 'd'
+
+    def open_stream(self, query, server_side=False, stats=NO_STATS):
+        self.streams.append(_Stream(self.rows, server_side))
+        return self.streams[-1]
+
+
+def _ids(rows):
+    return [int(x[0]) for x in rows]
+
+
+class TableSessionKeysetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.session = TableSession(_Table(35))
+
+    def test_next_and_prev(self):
+        s = self.session
+        self.assertEqual(_ids(s.get_list()), list(range(1, 11)))
+        s.next_page()
+        self.assertEqual(_ids(s.get_list()), list(range(11, 21)))
+        self.assertEqual(s.index_from_1, 11)
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(1, 11)))
+        self.assertFalse(s.has_prev())
+
+    def test_prev_after_jump(self):
+        s = self.session
+        s.jump(3)
+        self.assertEqual(_ids(s.get_list()), list(range(21, 31)))
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(11, 21)))
+        self.assertEqual(s.index_from_1, 11)
+
+    def test_prev_after_jump_past_the_end(self):
+        s = self.session
+        s.jump(6)
+        self.assertEqual(s.get_list(), [])
+        s.prev_page()
+        self.assertEqual(s.get_list(), [])
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(31, 36)))
+        self.assertEqual(s.index_from_1, 31)
+        self.assertTrue(s.has_prev())
+
+    def test_prev_after_jump_to_the_second_page_past_the_end(self):
+        s = TableSession(_Table(5))
+        s.jump(2)
+        self.assertEqual(s.get_list(), [])
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(1, 6)))
+        self.assertEqual(s.index_from_1, 1)
+        self.assertFalse(s.has_prev())
+
+    def test_prev_from_a_seek_anchor(self):
+        s = self.session
+        s.seek((25,))
+        self.assertEqual(_ids(s.get_list()), list(range(25, 35)))
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(15, 25)))
+        self.assertEqual(s.index_from_1, 1)
+        self.assertTrue(s.has_prev())
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(5, 15)))
+        self.assertEqual(s.index_from_1, 1)
+        s.prev_page()
+        self.assertEqual(_ids(s.get_list()), list(range(1, 11)))
+        self.assertFalse(s.has_prev())
+
+
+class FreeQueryStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.database = _Database(35)
+        self.session = FreeQuerySession(self.database, 'select id from t')
+
+    def test_pages_are_read_from_the_held_stream(self):
+        s = self.session
+        self.assertEqual(_ids(s.get_list()), list(range(1, 11)))
+        s.next_page()
+        self.assertEqual(_ids(s.get_list()), list(range(11, 21)))
+        self.assertEqual(len(self.database.streams), 1)
+
+    def test_stream_dropped_by_the_server_is_opened_again(self):
+        s = self.session
+        s.get_list()
+        self.database.streams[0].error = MySQLdb.OperationalError(
+            2013, 'Lost connection to MySQL server during query')
+        s.next_page()
+        self.assertEqual(_ids(s.get_list()), list(range(11, 21)))
+        self.assertEqual(len(self.database.streams), 2)
+
+    def test_other_errors_are_raised(self):
+        s = self.session
+        s.get_list()
+        self.database.streams[0].error = MySQLdb.OperationalError(
+            1317, 'Query execution was interrupted')
+        s.next_page()
+        self.assertRaises(MySQLdb.OperationalError, s.get_list)
+        self.assertEqual(len(self.database.streams), 1)
+
+    def test_export_query(self):
+        s = self.session
+        self.assertEqual(s.export_query, None) # no result yet
+        s.get_list()
+        self.assertEqual(s.export_query, 'select id from t')
+        s = FreeQuerySession(self.database, 'update t set id = id + 1')
+        s.get_list()
+        self.assertEqual(s.export_query, None)
+
+    def test_frontier_page_is_read_from_the_spill_file(self):
+        database = _Database(100)
+        database._options.update(spill=True, page_cache_size=2)
+        s = FreeQuerySession(database, 'select id from t')
+        try:
+            for _ in range(4):
+                s.get_list()
+                s.next_page()
+            self.assertEqual(_ids(s.get_list()), list(range(41, 51)))
+            for _ in range(4):
+                s.prev_page()
+                s.get_list()
+            for _ in range(4):
+                s.next_page()
+                s.get_list()
+            self.assertEqual(_ids(s.get_list()), list(range(41, 51)))
+            self.assertEqual(s.stats.source, 'spill')
+            self.assertTrue(s.has_next)
+            self.assertEqual(len(database.streams), 1)
+            s.next_page()
+            self.assertEqual(_ids(s.get_list()), list(range(51, 61)))
+            self.assertEqual(len(database.streams), 1)
+        finally:
+            s.close()
+
+
+class PageStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.finished = []
+        stats.query_finished.connect(self._on_finished)
+
+    def tearDown(self):
+        stats.query_finished.disconnect(self._on_finished)
+
+    def _on_finished(self, s):
+        self.finished.append(s)
+
+    def test_prefetched_page_is_finished_when_rendered(self):
+        s = TableSession(_Table(35))
+        s.get_list()
+        self.assertEqual(s.prefetch(1), 1)
+        self.assertEqual(self.finished, [])
+        s.next_page()
+        s.get_list()
+        self.assertFalse(s.stats.finished) # the view times the render
+        self.assertEqual(s.stats.source, 'server')
+        d = s.stats.as_dict()
+        self.assertEqual(d['page_rows'], 10)
+        self.assertTrue(d['page_bytes'] > 0)
+        self.assertFalse('bytes' in d or 'rows' in d)
+
+    def test_unrendered_page_is_finished_when_evicted(self):
+        s = TableSession(_Table(35, page_cache_size=3))
+        s.get_list()
+        s.prefetch(1)
+        prefetched = list(self.finished)
+        s.close()
+        self.assertEqual(len(self.finished), len(prefetched) + 2)
+        self.assertTrue(all(x.finished for x in self.finished))
+
+    def test_failed_read_is_finished_with_the_error(self):
+        table = _Table(35)
+        table.error = ValueError('gone')
+        s = TableSession(table)
+        self.assertRaises(ValueError, s.get_list)
+        self.assertEqual(len(self.finished), 1)
+        self.assertEqual(self.finished[0].as_dict()['error'], 'gone')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+from mystique.spill import SpillStore
+
+
+class SpillStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = SpillStore(('id', 'name'), directory=self.dir)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_read_in_the_order_rows_came(self):
+        self.assertTrue(self.store.append([(1, 'a'), (2, 'b')]))
+        self.assertTrue(self.store.append([(3, 'c')]))
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.read(1, 10), [(2, 'b'), (3, 'c')])
+
+    def test_bigint_unsigned_is_kept_as_text(self):
+        big = 2 ** 64 - 1
+        self.assertTrue(self.store.append([(big, 'max'), (-2 ** 63, 'min')]))
+        self.assertFalse(self.store.full)
+        self.assertEqual(self.store.read(0, 2),
+                         [(str(big), 'max'), (-2 ** 63, 'min')])
+
+    def test_full_over_max_bytes(self):
+        store = SpillStore(('v',), directory=self.dir, max_bytes=100)
+        try:
+            self.assertTrue(store.append([('x' * 10,)]))
+            self.assertFalse(store.append([('x' * 100,)]))
+            self.assertTrue(store.full)
+            self.assertEqual(len(store), 1)
+        finally:
+            store.close()
+
+    def test_covers(self):
+        self.store.append([(i, 'r') for i in range(10)])
+        self.assertTrue(self.store.covers(0, 5))
+        self.assertFalse(self.store.covers(5, 5))
+        self.store.complete = True
+        self.assertTrue(self.store.covers(5, 5))
+
+    def test_sort_like_a_page(self):
+        self.store.append([(1, 'b'), (2, None), (3, '10'), (4, 'A'),
+                           (5, '9'), (6, '0')])
+        self.store.complete = True
+        self.store.sort(1)
+        self.assertEqual([x[0] for x in self.store.read(0, 10)],
+                         [2, 6, 5, 3, 4, 1])
+        self.store.sort(1, descending=True)
+        self.assertEqual([x[0] for x in self.store.read(0, 10)],
+                         [1, 4, 3, 5, 6, 2])
+        self.assertEqual([x[0] for x in self.store.read(2, 2)], [3, 5])
+        self.store.sort(None)
+        self.assertEqual([x[0] for x in self.store.read(0, 3)], [1, 2, 3])
+
+    def test_sort_needs_every_row(self):
+        self.store.append([(1, 'a')])
+        self.assertRaises(ValueError, self.store.sort, 0)
+
+    def test_find(self):
+        self.store.append([(1, 'apple'), (2, 'Banana'), (3, 'cherry'),
+                           (4, 'banana split'), (5, '100%')])
+        self.assertEqual(self.store.find('banana', -1), 1)
+        self.assertEqual(self.store.find('banana', 1), 3)
+        self.assertEqual(self.store.find('banana', 3), None)
+        self.assertEqual(self.store.find('banana', 3, backward=True), 1)
+        self.assertEqual(self.store.find('%', -1), 4)
+        self.assertEqual(self.store.find('0%', -1), 4)
+        self.assertEqual(self.store.find('_', -1), None)
+        self.assertEqual(self.store.find('3', -1), 2)
+
+    def test_find_in_sorted_order(self):
+        self.store.append([(1, 'b x'), (2, 'a x'), (3, 'c')])
+        self.store.complete = True
+        self.store.sort(1, descending=True)
+        self.assertEqual(self.store.find('x', -1), 1)
+        self.assertEqual(self.store.find('x', 1), 2)
+        self.assertEqual(self.store.find('x', 2, backward=True), 1)
+
+    def test_close_removes_the_file(self):
+        path = self.store.path
+        self.assertTrue(os.path.exists(path))
+        self.store.close()
+        self.assertFalse(os.path.exists(path))
+        self.store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import subprocess
+import sys
+import unittest
+from mystique import stats
+
+
+class _StatusCursor(object):
+    """SHOW SESSION STATUS of a server where each read of it sends 100
+    bytes and makes a temp table"""
+
+    def __init__(self):
+        self.reads = 0
+        self.sent = 0
+
+    def execute(self, sql, params=None):
+        self.reads += 1
+
+    def fetchall(self):
+        ret = [('Bytes_sent', str(self.sent)),
+               ('Created_tmp_tables', str(self.reads)),
+               ('Handler_read_key', '7')]
+        self.sent += 100
+        return ret
+
+
+class StatusOverheadTest(unittest.TestCase):
+
+    def test_measured_once_per_server(self):
+        cursor = _StatusCursor()
+        overhead = stats.status_overhead(cursor, ('test', 1))
+        self.assertEqual(overhead, {'Bytes_sent': 100, 'Created_tmp_tables': 1,
+                                    'Handler_read_key': 0})
+        self.assertEqual(cursor.reads, 2)
+        self.assertTrue(stats.status_overhead(cursor, ('test', 1)) is overhead)
+        self.assertEqual(cursor.reads, 2)
+
+    def test_subtracted_from_deltas(self):
+        cursor = _StatusCursor()
+        overhead = stats.status_overhead(cursor, ('test', 2))
+        before = stats.read_status(cursor)
+        cursor.sent += 40 # the query
+        after = stats.read_status(cursor)
+        s = stats.QueryStats('select 1', server_status=True)
+        s.set_status(before, after, overhead)
+        self.assertEqual(dict(s.status), {'Bytes_sent': 40})
+
+
+class QueryStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.finished = []
+        stats.query_finished.connect(self._on_finished)
+
+    def tearDown(self):
+        stats.query_finished.disconnect(self._on_finished)
+
+    def _on_finished(self, s):
+        self.finished.append(s)
+
+    def test_phases(self):
+        s = stats.QueryStats('select 1')
+        s.start()
+        s.mark('execute')
+        self.assertTrue(s.phases['execute'] >= 0)
+        self.assertEqual(list(s.phases), list(stats.PHASES))
+
+    def test_finished_once(self):
+        s = stats.QueryStats('select 1')
+        s.finish()
+        s.finish()
+        self.assertEqual(self.finished, [s])
+        self.assertEqual(s.as_dict()['error'], None)
+
+    def test_no_stats(self):
+        stats.NO_STATS.start()
+        stats.NO_STATS.mark('execute')
+        stats.NO_STATS.set_status({}, {})
+        self.assertFalse(stats.NO_STATS.server_status)
+
+
+class SignalTest(unittest.TestCase):
+
+    def test_db_layer_does_not_load_blinker(self):
+        code = ('import sys\n'
+                'import mystique.cli, mystique.batch, mystique.db, '
+                'mystique.export, mystique.dump\n'
+                'stats = sys.modules["mystique.stats"]\n'
+                'stats.QueryStats("select 1").finish()\n'
+                'sys.exit("blinker" in sys.modules)\n')
+        self.assertEqual(subprocess.call([sys.executable, '-c', code]), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# -*- encoding:utf8 -*-
+from __future__ import absolute_import
+import unittest
+from mystique.wordindex import WordIndex
+
+
+class WordIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = WordIndex(['users', 'user_roles', 'orders', 'Order_Items',
+                                'id', 'users'])
+
+    def test_duplicates_are_added_once(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.add(['id', 'name']), 1)
+        self.assertEqual(self.index.items[-1], 'name')
+
+    def test_prefix_in_the_order_added(self):
+        self.assertEqual(self.index.search('USER'), ['users', 'user_roles'])
+        self.assertEqual(self.index.search('ord'), ['orders', 'Order_Items'])
+        self.assertEqual(self.index.search('x'), [])
+
+    def test_partial(self):
+        self.assertEqual(self.index.search('er', partial=True),
+                         ['users', 'user_roles', 'orders', 'Order_Items'])
+        self.assertEqual(self.index.search('roles', partial=True),
+                         ['user_roles'])
+        self.assertEqual(self.index.search('der_it', partial=True),
+                         ['Order_Items'])
+
+    def test_exclude_exact(self):
+        self.assertEqual(self.index.search('users', exclude_exact=True), [])
+        self.assertEqual(self.index.search('id'), ['id'])
+
+    def test_limit_ranks_prefixes_first(self):
+        index = WordIndex(['xorders', 'orders_archive', 'orders'],
+                          rank=lambda x:0)
+        self.assertEqual(index.search('orders', partial=True, limit=2),
+                         ['orders', 'orders_archive'])
+        index = WordIndex(['b_col', 'a_col'], rank=lambda x:x != 'b_col')
+        self.assertEqual(index.search('col', partial=True, limit=1),
+                         ['b_col'])
+
+    def test_key(self):
+        index = WordIndex([('users', 'table'), ('id', 'column')],
+                          key=lambda x:x[0])
+        self.assertEqual(index.search('us'), [('users', 'table')])
+
+
+if __name__ == '__main__':
+    unittest.main()